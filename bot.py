@@ -1,12 +1,14 @@
 import asyncio
+import heapq
 import logging
-from datetime import datetime, timedelta, time as _time
-import json
-from typing import Dict
-import threading
+from datetime import date as _date, datetime, timedelta, time as _time
+import orjson
+from typing import Dict, List, Tuple
+from sqlalchemy.exc import OperationalError
 import time
 from config import Config
-from database import DatabaseManager, User
+from database import DatabaseManager
+from caldav_manager import CalDAVManager, shutdown_parse_pool
 from mattermost_manager import MattermostManager
 from bot_logic import BotLogic
 from ui_messages import UIMessages, ButtonActions
@@ -21,50 +23,129 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+_ACTIONS_URL = f"{Config.MM_ACTIONS_URL}/mattermost/actions"
+
+
+def _button(name: str, action: str, style: str = None, button_type: str = "button", **context) -> Dict:
+    """Кнопка интерактивного сообщения; подстановки вида {user_id} заполняются при отправке"""
+    button = {
+        "name": name,
+        "integration": {
+            "url": _ACTIONS_URL,
+            "context": {"action": action, "user_id": "{user_id}", **context},
+        },
+    }
+    if button_type:
+        button["type"] = button_type
+    if style:
+        button["style"] = style
+    return button
+
+
+def _attachments_template(fallback: str, actions: list, color: str = None) -> str:
+    """Сериализовать вложения один раз при загрузке модуля"""
+    attachment = {"fallback": fallback}
+    if color:
+        attachment["color"] = color
+    attachment["actions"] = actions
+    return orjson.dumps([attachment]).decode('utf-8')
+
+
+def _render(template: str, **values) -> str:
+    """Подставить динамические поля в готовый JSON шаблон"""
+    for key, value in values.items():
+        template = template.replace("{" + key + "}", value)
+    return template
+
+
+_CANCEL_BUTTON = _button("Отменить", ButtonActions.CANCEL_WIZARD, style="danger")
+
+_MAIN_MENU_ATTACHMENTS = _attachments_template("Main Menu", [
+    _button("Все встречи на сегодня", ButtonActions.TODAY_ALL_MEETINGS, button_type=None),
+    _button("Текущие встречи", ButtonActions.TODAY_CURRENT_MEETINGS, button_type=None),
+    _button("Создать встречу", ButtonActions.CREATE_MEETING, button_type=None),
+    # _button("RAW CALDAV", ButtonActions.RAW_CALDAV, button_type=None),
+    _button("Разлогиниться", ButtonActions.LOGOUT, style="danger", button_type=None),
+], color="#3AA3E3")
+
+_CANCEL_ATTACHMENTS = _attachments_template("Cancel", [_CANCEL_BUTTON])
+
+_DATE_ATTACHMENTS = _attachments_template("Быстрый выбор даты", [
+    _button("Сегодня", "quick_date", date="{today}"),
+    _button("Завтра", "quick_date", date="{tomorrow}"),
+    _button("Послезавтра", "quick_date", date="{after_tomorrow}"),
+    _CANCEL_BUTTON,
+])
+
+_TIME_ATTACHMENTS = _attachments_template("Быстрый выбор времени", [
+    _button("В следующий час", "quick_time", time="{next_hour}"),
+    _button("Через час", "quick_time", time="{plus_60}"),
+    _CANCEL_BUTTON,
+])
+
+_ATTENDEES_ATTACHMENTS = _attachments_template("Attendees actions", [
+    _button("Никого не приглашать", ButtonActions.NO_INVITE, style="primary"),
+    _CANCEL_BUTTON,
+])
+
+_DESCRIPTION_ATTACHMENTS = _attachments_template("Description actions", [
+    _button("Не добавлять", "skip_description"),
+    _CANCEL_BUTTON,
+])
+
+_LOCATION_ATTACHMENTS = _attachments_template("Location actions", [
+    _button("Не добавлять", "skip_location"),
+    _CANCEL_BUTTON,
+])
+
 
 class Bot:
     def __init__(self):
         self.db = DatabaseManager(Config.DB_PATH)
         self.mm = MattermostManager(Config.MATTERMOST_BASE_URL, 
                                     Config.MATTERMOST_BOT_TOKEN,
-                                    Config.BOT_NAME)
+                                    Config.BOT_NAME,
+                                    Config.MM_POOL_SIZE)
         self.logic = BotLogic(self.db, self.mm)
         self.notification_manager = NotificationManager(self.db, self.mm, self.logic)
         self.ws_listener = MattermostWebSocketListener(self)
         self.running = False
         self.web_runner = None
-        # Основной event loop будет сохранён при старте
+        # Основной event loop и задача WebSocket-слушателя будут сохранены при старте
         self.loop = None
-        self.loop_ready = threading.Event()
+        self.ws_task = None
+        # Расписание проверок: min-heap (следующий запуск, user_id) + актуальный срок по пользователю
+        self._schedule_heap: List[Tuple[float, str]] = []
+        self._schedule_due: Dict[str, float] = {}
+        self._schedule_wakeup = asyncio.Event()
+        # Долгоживущая сессия цикла уведомлений (создаётся в run_main_loop)
+        self._notif_session = None
+        # Обработчики шагов диалога: состояние -> корутина (user_id, channel_id, user_state, state_data, message)
+        self._dialog_handlers = {
+            "awaiting_password": self._step_password,
+            "creating_meeting_title": self._step_title,
+            "creating_meeting_date": self._step_date,
+            "creating_meeting_time": self._step_time,
+            "creating_meeting_duration": self._step_duration,
+            "creating_meeting_attendees": self._step_attendees,
+            "creating_meeting_description": self._step_description,
+            "creating_meeting_location": self._step_location,
+        }
 
     async def ask_meeting_title(self, user_id: str, channel_id: str, state_data: Dict = None):
         """Попросить название встречи с кнопкой Отменить"""
         message = UIMessages.create_meeting_step_1()
-        attachments = [{
-            "fallback": "Cancel",
-            "actions": [{
-                "name": "Отменить",
-                "style": "danger",
-                "type": "button",
-                "integration": {
-                    "url": f"{Config.MM_ACTIONS_URL}/mattermost/actions",
-                    "context": {
-                        "action": ButtonActions.CANCEL_WIZARD,
-                        "user_id": user_id,
-                    },
-                },
-            }],
-        }]
-        post = await self.mm.create_post_with_attachments(channel_id, message, attachments)
+        attachments_json = _render(_CANCEL_ATTACHMENTS, user_id=user_id)
+        post = await self.mm.create_post_with_attachments(channel_id, message,
+                                                          attachments_json=attachments_json)
         post_id = post.get('id') if isinstance(post, dict) else post
-        self.logic.set_user_state(user_id, "creating_meeting_title", state_data or {}, post_id)
+        self.logic.set_wizard_state(user_id, "creating_meeting_title", state_data or {}, post_id)
     
     def start(self):
         """Запустить бота"""
         logger.info("Starting calendar bot...")
         
         self.running = True
-        self.loop_ready.clear()
         
         # Запустить основной цикл
         try:
@@ -79,30 +160,65 @@ class Bot:
     def stop(self):
         """Остановить бота"""
         logger.info("Stopping bot...")
-        if not self.running:
+        self.running = False
+        try:
+            self.logic.flush_wizard_state()
+        except Exception as e:
+            logger.error(f"Error saving wizard state: {e}")
+        loop = self.loop
+        try:
+            current_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            current_loop = None
+
+        if loop is not None and loop.is_running():
+            # Ресурсы (aiohttp-сессии, веб-сервер) привязаны к основному loop —
+            # чистим их там же и будим цикл уведомлений, чтобы run_main_loop завершился
+            loop.call_soon_threadsafe(self._schedule_wakeup.set)
+            if current_loop is loop:
+                return
+            future = asyncio.run_coroutine_threadsafe(self._cleanup(), loop)
+            try:
+                future.result(timeout=10)
+            except Exception as e:
+                logger.error(f"Error during cleanup: {e}")
             return
 
-        self.running = False
-        asyncio.run(self._cleanup())
+        # Основной loop уже завершён: run_main_loop обычно успевает всё закрыть сам,
+        # отдельный loop поднимаем только если что-то осталось открытым
+        if self.web_runner or self.logic.has_caldav_sessions() or self.mm.session or self.ws_listener.session:
+            asyncio.run(self._cleanup())
         self.db.close()
     
     async def _cleanup(self):
         """Очистка ресурсов"""
         # Остановить WebSocket
-        self.ws_listener.running = False
+        if self.ws_task is not None:
+            task, self.ws_task = self.ws_task, None
+            task.cancel()
+        await self.ws_listener.disconnect()
         
         # Остановить Mattermost сессию
         await self.mm.disconnect()
         
+        # Закрыть CalDAV-сессии из пула и пул процессов разбора ICS
+        await self._close_caldav_pool()
+        shutdown_parse_pool()
+        
         # Остановить веб-сервер
         if self.web_runner:
-            await self.web_runner.cleanup()
+            runner, self.web_runner = self.web_runner, None
+            await runner.cleanup()
+        
+        # Закрыть сессию цикла уведомлений
+        if self._notif_session is not None:
+            session, self._notif_session = self._notif_session, None
+            session.close()
     
     async def run_main_loop(self):
         """Основной цикл бота"""
-        # Сохранить текущий event loop, чтобы использовать его из других потоков
+        # Сохранить текущий event loop, чтобы stop() мог вызываться из других потоков
         self.loop = asyncio.get_running_loop()
-        self.loop_ready.set()
         # Подключиться к Mattermost
         if not await self.mm.connect():
             logger.error("Failed to connect to Mattermost")
@@ -110,8 +226,11 @@ class Bot:
         
         logger.info("Bot connected successfully")
         
-        # Запустить WebSocket слушатель (синхронный в отдельном потоке)
-        self.ws_listener.connect()
+        # Прогреть пул соединений, чтобы первое действие пользователя не ждало TLS-рукопожатия
+        await self.mm.warm_up()
+        
+        # Запустить WebSocket слушатель (корутина в этом же event loop)
+        self.ws_task = asyncio.create_task(self.ws_listener.run())
         logger.info("WebSocket listener started")
         
         # Запустить веб-сервер для обработки действий (вебхуки и интерактивные кнопки)
@@ -119,7 +238,9 @@ class Bot:
         logger.info("Waiting for webhooks and button actions...")
         
         # Запустить цикл проверки уведомлений
+        self._notif_session = self.db.new_session()
         check_task = asyncio.create_task(self.check_notifications_loop())
+        evict_task = asyncio.create_task(self._evict_idle_caldav_loop())
         
         try:
             await check_task
@@ -127,25 +248,30 @@ class Bot:
             logger.error(f"Error in main loop: {e}")
         finally:
             self.running = False
+            evict_task.cancel()
+            await self._cleanup()
     
     async def check_notifications_loop(self):
-        """Цикл проверки и отправки уведомлений"""
+        """Цикл проверки и отправки уведомлений (по ближайшему сроку из heap)"""
         interval = max(1, Config.CHECK_INTERVAL)
-        next_tick = self._next_schedule_tick(interval)
+
+        heap = self._schedule_heap
+
+        self._refresh_schedule(interval)
 
         while self.running:
-            await self._sleep_until(next_tick)
+            deadline = heap[0][0] if heap else time.time() + interval
+            await self._wait_for_schedule(deadline)
             if not self.running:
                 break
 
             try:
-                session = self.db.get_session()
-                try:
-                    users = session.query(User).all()
-                finally:
-                    session.close()
+                users = self._refresh_schedule(interval)
+                due_users = self._pop_due_users(users, interval)
+                if not due_users:
+                    continue
 
-                notification_count = await self.notification_manager.check_and_notify(users)
+                notification_count = await self.notification_manager.check_and_notify(due_users)
 
                 if notification_count > 0:
                     logger.info(f"Sent {notification_count} notifications")
@@ -153,7 +279,66 @@ class Bot:
             except Exception as e:
                 logger.error(f"Error in notifications loop: {e}")
 
-            next_tick = self._next_schedule_tick(interval)
+    def schedule_user_now(self, user_id: str):
+        """Поставить проверку пользователя в расписание немедленно (например, после авторизации)"""
+        due = time.time()
+        self._schedule_due[user_id] = due
+        heapq.heappush(self._schedule_heap, (due, user_id))
+        self._schedule_wakeup.set()
+
+    def _refresh_schedule(self, interval: int) -> Dict:
+        """Синхронизировать расписание со снимком пользователей и вернуть его (user_id -> снимок)"""
+        try:
+            # Снимок пользователей из кэша BotLogic; БД читается только после записи или по TTL
+            users = {u.mattermost_id: u for u in self.logic.get_users_snapshot(self._notif_session)}
+        except OperationalError as e:
+            # Соединение сессии испорчено — пересоздаём её к следующему тику
+            logger.error(f"Notifications DB session failed, reconnecting: {e}")
+            if self._notif_session is not None:
+                self._notif_session.close()
+                self._notif_session = self.db.new_session()
+            return {}
+        except Exception as e:
+            logger.error(f"Error loading users for notifications: {e}")
+            return {}
+        self._sync_schedule(users, interval)
+        return users
+
+    def _sync_schedule(self, users: Dict, interval: int):
+        """Добавить в расписание новых пользователей и забыть удалённых"""
+        for user_id in list(self._schedule_due):
+            if user_id not in users:
+                # Запись в heap станет «протухшей» и будет пропущена при извлечении
+                del self._schedule_due[user_id]
+        first_slot = None
+        for user_id in users:
+            if user_id not in self._schedule_due:
+                if first_slot is None:
+                    first_slot = self._next_schedule_tick(interval)
+                self._schedule_due[user_id] = first_slot
+                heapq.heappush(self._schedule_heap, (first_slot, user_id))
+
+    def _pop_due_users(self, users: Dict, interval: int) -> list:
+        """Извлечь из heap пользователей, чей срок наступил, и запланировать их следующий запуск"""
+        now = time.time()
+        tolerance = 0.05
+        due_users = []
+        while self._schedule_heap and self._schedule_heap[0][0] <= now + tolerance:
+            due, user_id = heapq.heappop(self._schedule_heap)
+            if self._schedule_due.get(user_id) != due:
+                continue
+            user = users.get(user_id)
+            if user is None:
+                del self._schedule_due[user_id]
+                continue
+            due_users.append(user)
+            # Абсолютные сроки без дрейфа; пропущенные слоты не навёрстываем
+            next_due = due + interval
+            if next_due <= now:
+                next_due += ((now - next_due) // interval + 1) * interval
+            self._schedule_due[user_id] = next_due
+            heapq.heappush(self._schedule_heap, (next_due, user_id))
+        return due_users
     
     async def handle_message(self, user_id: str, message: str, channel_id: str):
         """Обработать входящее сообщение"""
@@ -191,7 +376,7 @@ class Bot:
             email = ''
             if user_state and user_state.data:
                 try:
-                    state_data = json.loads(user_state.data)
+                    state_data = self.logic.get_state_data(user_state)
                     email = state_data.get('email', '')
                 except Exception:
                     email = ''
@@ -208,6 +393,7 @@ class Bot:
             # Создать пользователя с новым паролем
             self.logic.create_user(user_id, email, password)
             logger.info(f"User {user_id} authenticated with email {email}")
+            self.schedule_user_now(user_id)
 
             # Очистить состояние авторизации
             self.logic.clear_user_state(user_id)
@@ -232,66 +418,11 @@ class Bot:
         try:
             message = UIMessages.main_menu_message()
             
-            # Создать интерактивные кнопки
-            attachments = [{
-                "fallback": "Main Menu",
-                "color": "#3AA3E3",
-                "actions": [
-                    {
-                        "name": "Все встречи на сегодня",
-                        "integration": {
-                            "url": f"{Config.MM_ACTIONS_URL}/mattermost/actions",
-                            "context": {
-                                "action": ButtonActions.TODAY_ALL_MEETINGS,
-                                "user_id": user_id
-                            }
-                        }
-                    },
-                    {
-                        "name": "Текущие встречи",
-                        "integration": {
-                            "url": f"{Config.MM_ACTIONS_URL}/mattermost/actions",
-                            "context": {
-                                "action": ButtonActions.TODAY_CURRENT_MEETINGS,
-                                "user_id": user_id
-                            }
-                        }
-                    },
-                    {
-                        "name": "Создать встречу",
-                        "integration": {
-                            "url": f"{Config.MM_ACTIONS_URL}/mattermost/actions",
-                            "context": {
-                                "action": ButtonActions.CREATE_MEETING,
-                                "user_id": user_id
-                            }
-                        }
-                    },
-                    # {
-                    #     "name": "RAW CALDAV",
-                    #     "integration": {
-                    #         "url": f"{Config.MM_ACTIONS_URL}/mattermost/actions",
-                    #         "context": {
-                    #             "action": ButtonActions.RAW_CALDAV,
-                    #             "user_id": user_id
-                    #         }
-                    #     }
-                    # },
-                    {
-                        "name": "Разлогиниться",
-                        "integration": {
-                            "url": f"{Config.MM_ACTIONS_URL}/mattermost/actions",
-                            "context": {
-                                "action": ButtonActions.LOGOUT,
-                                "user_id": user_id
-                            }
-                        },
-                        "style": "danger"
-                    }
-                ]
-            }]
+            # Интерактивные кнопки из заранее сериализованного шаблона
+            attachments_json = _render(_MAIN_MENU_ATTACHMENTS, user_id=user_id)
             
-            await self.mm.create_post_with_attachments(channel_id, message, attachments)
+            await self.mm.create_post_with_attachments(channel_id, message,
+                                                       attachments_json=attachments_json)
             
             # Очистить состояние пользователя
             self.logic.clear_user_state(user_id)
@@ -301,100 +432,98 @@ class Bot:
     async def handle_dialog_step(self, user_id: str, channel_id: str, 
                                 user_state, message: str):
         """Обработать шаг диалога"""
-        current_state = user_state.state
-        state_data = json.loads(user_state.data) if user_state.data else {}
-        
-        if current_state == "awaiting_password":
-            await self.handle_auth_message(user_id, channel_id, message.strip())
-        
-        elif current_state == "creating_meeting_title":
-            state_data['title'] = message.strip()
-            # Скрыть кнопку Отменить после ввода названия
-            if user_state.message_id:
-                try:
-                    await self.mm.update_post(user_state.message_id, f"Название встречи: ✅ {message.strip()}")
-                except Exception:
-                    pass
-            await self.ask_meeting_date(user_id, channel_id, state_data)
-        
-        elif current_state == "creating_meeting_date":
-            date_obj = self.logic.validate_date(message.strip())
-            if date_obj:
-                state_data['date'] = date_obj.isoformat()
-                # Очистить кнопки предыдущего сообщения
-                if user_state.message_id:
-                    try:
-                        await self.mm.update_post(user_state.message_id, f"Дата встречи: ✅ {message.strip()}")
-                    except Exception:
-                        pass
-                await self.ask_meeting_time(user_id, channel_id, state_data)
-            else:
-                await self.mm.send_message(channel_id, 
-                    "❌ Некорректный формат даты. Попробуйте снова (DD.MM.YYYY)")
-        
-        elif current_state == "creating_meeting_time":
-            time_obj = self.logic.validate_time(message.strip())
-            if time_obj:
-                state_data['time'] = time_obj.isoformat()
-                # Очистить кнопки
-                if user_state.message_id:
-                    try:
-                        await self.mm.update_post(user_state.message_id, f"Время начала: ✅ {message.strip()}")
-                    except Exception:
-                        pass
-                await self.ask_meeting_duration(user_id, channel_id, state_data)
-            else:
-                await self.mm.send_message(channel_id,
-                    "❌ Некорректный формат времени. Попробуйте снова (HH:MM)")
-        
-        elif current_state == "creating_meeting_duration":
-            minutes = self.logic.validate_minutes(message.strip())
-            if minutes:
-                state_data['duration'] = minutes
-                # Очистить кнопки
-                if user_state.message_id:
-                    try:
-                        await self.mm.update_post(user_state.message_id, f"Длительность: ✅ {message.strip()} мин")
-                    except Exception:
-                        pass
-                await self.ask_meeting_attendees(user_id, channel_id, state_data)
-            else:
-                await self.mm.send_message(channel_id,
-                    "❌ Введите корректное количество минут (1-1440)")
-        
-        elif current_state == "creating_meeting_attendees":
-            attendees = await self.logic.parse_attendees(message)
-            state_data['attendees'] = attendees
-            # Очистить кнопки
-            if user_state.message_id:
-                try:
-                    att_str = ", ".join(attendees) if attendees else "без участников"
-                    await self.mm.update_post(user_state.message_id, f"Участники: ✅ {att_str}")
-                except Exception:
-                    pass
-            await self.ask_meeting_description(user_id, channel_id, state_data)
-        
-        elif current_state == "creating_meeting_description":
-            state_data['description'] = message.strip()
-            # Очистить кнопки
-            if user_state.message_id:
-                try:
-                    desc_preview = message.strip()[:50] + "..." if len(message.strip()) > 50 else message.strip()
-                    await self.mm.update_post(user_state.message_id, f"Описание: ✅ {desc_preview}")
-                except Exception:
-                    pass
-            await self.ask_meeting_location(user_id, channel_id, state_data)
-        
-        elif current_state == "creating_meeting_location":
-            state_data['location'] = message.strip()
-            # Очистить кнопки
-            if user_state.message_id:
-                try:
-                    loc_preview = message.strip()[:50] + "..." if len(message.strip()) > 50 else message.strip()
-                    await self.mm.update_post(user_state.message_id, f"Место: ✅ {loc_preview}")
-                except Exception:
-                    pass
-            await self.create_meeting(user_id, channel_id, state_data)
+        handler = self._dialog_handlers.get(user_state.state)
+        if handler is None:
+            return
+        state_data = self.logic.get_state_data(user_state)
+        await handler(user_id, channel_id, user_state, state_data, message)
+
+    async def _step_password(self, user_id: str, channel_id: str, user_state, state_data: Dict, message: str):
+        await self.handle_auth_message(user_id, channel_id, message.strip())
+
+    async def _step_title(self, user_id: str, channel_id: str, user_state, state_data: Dict, message: str):
+        text = message.strip()
+        state_data['title'] = text
+        # Скрыть кнопку Отменить после ввода названия
+        await self._complete_step(user_state.message_id, f"Название встречи: ✅ {text}",
+                                  self.ask_meeting_date(user_id, channel_id, state_data))
+
+    async def _step_date(self, user_id: str, channel_id: str, user_state, state_data: Dict, message: str):
+        text = message.strip()
+        date_obj = self.logic.validate_date(text)
+        if not date_obj:
+            await self.mm.send_message(channel_id, 
+                "❌ Некорректный формат даты. Попробуйте снова (DD.MM.YYYY)")
+            return
+        state_data['date'] = date_obj.isoformat()
+        # Очистить кнопки предыдущего сообщения
+        await self._complete_step(user_state.message_id, f"Дата встречи: ✅ {text}",
+                                  self.ask_meeting_time(user_id, channel_id, state_data))
+
+    async def _step_time(self, user_id: str, channel_id: str, user_state, state_data: Dict, message: str):
+        text = message.strip()
+        time_obj = self.logic.validate_time(text)
+        if not time_obj:
+            await self.mm.send_message(channel_id,
+                "❌ Некорректный формат времени. Попробуйте снова (HH:MM)")
+            return
+        state_data['time'] = time_obj.isoformat()
+        # Очистить кнопки
+        await self._complete_step(user_state.message_id, f"Время начала: ✅ {text}",
+                                  self.ask_meeting_duration(user_id, channel_id, state_data))
+
+    async def _step_duration(self, user_id: str, channel_id: str, user_state, state_data: Dict, message: str):
+        text = message.strip()
+        minutes = self.logic.validate_minutes(text)
+        if not minutes:
+            await self.mm.send_message(channel_id,
+                "❌ Введите корректное количество минут (1-1440)")
+            return
+        state_data['duration'] = minutes
+        # Очистить кнопки
+        await self._complete_step(user_state.message_id, f"Длительность: ✅ {text} мин",
+                                  self.ask_meeting_attendees(user_id, channel_id, state_data))
+
+    async def _step_attendees(self, user_id: str, channel_id: str, user_state, state_data: Dict, message: str):
+        attendees = await self.logic.parse_attendees(message)
+        state_data['attendees'] = attendees
+        # Очистить кнопки
+        att_str = ", ".join(attendees) if attendees else "без участников"
+        await self._complete_step(user_state.message_id, f"Участники: ✅ {att_str}",
+                                  self.ask_meeting_description(user_id, channel_id, state_data))
+
+    async def _step_description(self, user_id: str, channel_id: str, user_state, state_data: Dict, message: str):
+        text = message.strip()
+        state_data['description'] = text
+        # Очистить кнопки
+        desc_preview = text[:50] + "..." if len(text) > 50 else text
+        await self._complete_step(user_state.message_id, f"Описание: ✅ {desc_preview}",
+                                  self.ask_meeting_location(user_id, channel_id, state_data))
+
+    async def _step_location(self, user_id: str, channel_id: str, user_state, state_data: Dict, message: str):
+        text = message.strip()
+        state_data['location'] = text
+        # Очистить кнопки
+        loc_preview = text[:50] + "..." if len(text) > 50 else text
+        await self._complete_step(user_state.message_id, f"Место: ✅ {loc_preview}",
+                                  self.create_meeting(user_id, channel_id, state_data))
+
+    async def _complete_step(self, message_id: str, done_text: str, next_step):
+        """Отметить предыдущий шаг и запустить следующий параллельно.
+
+        Ошибка обновления старого поста игнорируется, как и раньше;
+        ошибка следующего шага пробрасывается вызывающему.
+        """
+        if not message_id:
+            await next_step
+            return
+        _, next_result = await asyncio.gather(
+            self.mm.update_post(message_id, done_text),
+            next_step,
+            return_exceptions=True,
+        )
+        if isinstance(next_result, BaseException):
+            raise next_result
     
     async def ask_meeting_date(self, user_id: str, channel_id: str, state_data: Dict):
         """Попросить дату встречи"""
@@ -403,18 +532,12 @@ class Bot:
         tomorrow = (today_dt + timedelta(days=1)).strftime("%d.%m.%Y")
         after_tomorrow = (today_dt + timedelta(days=2)).strftime("%d.%m.%Y")
         message = UIMessages.create_meeting_step_3(today)
-        attachments = [{
-            "fallback": "Быстрый выбор даты",
-            "actions": [
-                {"name": "Сегодня", "type": "button", "integration": {"url": f"{Config.MM_ACTIONS_URL}/mattermost/actions", "context": {"action": "quick_date", "user_id": user_id, "date": today}}},
-                {"name": "Завтра", "type": "button", "integration": {"url": f"{Config.MM_ACTIONS_URL}/mattermost/actions", "context": {"action": "quick_date", "user_id": user_id, "date": tomorrow}}},
-                {"name": "Послезавтра", "type": "button", "integration": {"url": f"{Config.MM_ACTIONS_URL}/mattermost/actions", "context": {"action": "quick_date", "user_id": user_id, "date": after_tomorrow}}},
-                {"name": "Отменить", "style": "danger", "type": "button", "integration": {"url": f"{Config.MM_ACTIONS_URL}/mattermost/actions", "context": {"action": ButtonActions.CANCEL_WIZARD, "user_id": user_id}}}
-            ]
-        }]
-        post = await self.mm.create_post_with_attachments(channel_id, message, attachments)
+        attachments_json = _render(_DATE_ATTACHMENTS, user_id=user_id, today=today,
+                                   tomorrow=tomorrow, after_tomorrow=after_tomorrow)
+        post = await self.mm.create_post_with_attachments(channel_id, message,
+                                                          attachments_json=attachments_json)
         post_id = post.get('id') if isinstance(post, dict) else post
-        self.logic.set_user_state(user_id, "creating_meeting_date", state_data, post_id)
+        self.logic.set_wizard_state(user_id, "creating_meeting_date", state_data, post_id)
     
     async def ask_meeting_time(self, user_id: str, channel_id: str, state_data: Dict):
         """Попросить время начала встречи"""
@@ -422,166 +545,68 @@ class Bot:
         now = datetime.now()
         next_hour = (now + timedelta(hours=1)).replace(minute=0, second=0, microsecond=0).strftime("%H:%M")
         plus_60 = (now + timedelta(minutes=60)).strftime("%H:%M")
-        attachments = [{
-            "fallback": "Быстрый выбор времени",
-            "actions": [
-                {"name": "В следующий час", "type": "button", "integration": {"url": f"{Config.MM_ACTIONS_URL}/mattermost/actions", "context": {"action": "quick_time", "user_id": user_id, "time": next_hour}}},
-                {"name": "Через час", "type": "button", "integration": {"url": f"{Config.MM_ACTIONS_URL}/mattermost/actions", "context": {"action": "quick_time", "user_id": user_id, "time": plus_60}}},
-                {"name": "Отменить", "style": "danger", "type": "button", "integration": {"url": f"{Config.MM_ACTIONS_URL}/mattermost/actions", "context": {"action": ButtonActions.CANCEL_WIZARD, "user_id": user_id}}}
-            ]
-        }]
-        post = await self.mm.create_post_with_attachments(channel_id, message, attachments)
+        attachments_json = _render(_TIME_ATTACHMENTS, user_id=user_id, next_hour=next_hour, plus_60=plus_60)
+        post = await self.mm.create_post_with_attachments(channel_id, message,
+                                                          attachments_json=attachments_json)
         post_id = post.get('id') if isinstance(post, dict) else post
-        self.logic.set_user_state(user_id, "creating_meeting_time", state_data, post_id)
+        self.logic.set_wizard_state(user_id, "creating_meeting_time", state_data, post_id)
     
     async def ask_meeting_duration(self, user_id: str, channel_id: str, state_data: Dict):
         """Попросить продолжительность встречи"""
         message = UIMessages.create_meeting_step_7()
 
-        attachments = [{
-            "fallback": "Cancel",
-            "actions": [{
-                "name": "Отменить",
-                "style": "danger",
-                "type": "button",
-                "integration": {
-                    "url": f"{Config.MM_ACTIONS_URL}/mattermost/actions",
-                    "context": {
-                        "action": ButtonActions.CANCEL_WIZARD,
-                        "user_id": user_id,
-                    },
-                },
-            }],
-        }]
-
-        post = await self.mm.create_post_with_attachments(channel_id, message, attachments)
+        attachments_json = _render(_CANCEL_ATTACHMENTS, user_id=user_id)
+
+        post = await self.mm.create_post_with_attachments(channel_id, message,
+                                                          attachments_json=attachments_json)
         post_id = None
         if post:
             post_id = post.get('id') if isinstance(post, dict) else post
         
-        self.logic.set_user_state(user_id, "creating_meeting_duration", state_data, post_id)
+        self.logic.set_wizard_state(user_id, "creating_meeting_duration", state_data, post_id)
     
     async def ask_meeting_attendees(self, user_id: str, channel_id: str, state_data: Dict):
         """Попросить участников встречи"""
         message = UIMessages.create_meeting_step_9()
 
         # Кнопки «Никого не приглашать» и «Отменить»
-        attachments = [{
-            "fallback": "Attendees actions",
-            "actions": [
-                {
-                    "name": "Никого не приглашать",
-                    "style": "primary",
-                    "type": "button",
-                    "integration": {
-                        "url": f"{Config.MM_ACTIONS_URL}/mattermost/actions",
-                        "context": {
-                            "action": ButtonActions.NO_INVITE,
-                            "user_id": user_id,
-                        },
-                    },
-                },
-                {
-                    "name": "Отменить",
-                    "style": "danger",
-                    "type": "button",
-                    "integration": {
-                        "url": f"{Config.MM_ACTIONS_URL}/mattermost/actions",
-                        "context": {
-                            "action": ButtonActions.CANCEL_WIZARD,
-                            "user_id": user_id,
-                        },
-                    },
-                },
-            ],
-        }]
-
-        post = await self.mm.create_post_with_attachments(channel_id, message, attachments)
+        attachments_json = _render(_ATTENDEES_ATTACHMENTS, user_id=user_id)
+
+        post = await self.mm.create_post_with_attachments(channel_id, message,
+                                                          attachments_json=attachments_json)
         post_id = None
         if post:
             post_id = post.get('id') if isinstance(post, dict) else post
         
-        self.logic.set_user_state(user_id, "creating_meeting_attendees", state_data, post_id)
+        self.logic.set_wizard_state(user_id, "creating_meeting_attendees", state_data, post_id)
     
     async def ask_meeting_description(self, user_id: str, channel_id: str, state_data: Dict):
         """Попросить описание встречи"""
         message = UIMessages.create_meeting_step_11()
         
-        attachments = [{
-            "fallback": "Description actions",
-            "actions": [
-                {
-                    "name": "Не добавлять",
-                    "type": "button",
-                    "integration": {
-                        "url": f"{Config.MM_ACTIONS_URL}/mattermost/actions",
-                        "context": {
-                            "action": "skip_description",
-                            "user_id": user_id,
-                        },
-                    },
-                },
-                {
-                    "name": "Отменить",
-                    "style": "danger",
-                    "type": "button",
-                    "integration": {
-                        "url": f"{Config.MM_ACTIONS_URL}/mattermost/actions",
-                        "context": {
-                            "action": ButtonActions.CANCEL_WIZARD,
-                            "user_id": user_id,
-                        },
-                    },
-                },
-            ],
-        }]
-        
-        post = await self.mm.create_post_with_attachments(channel_id, message, attachments)
+        attachments_json = _render(_DESCRIPTION_ATTACHMENTS, user_id=user_id)
+
+        post = await self.mm.create_post_with_attachments(channel_id, message,
+                                                          attachments_json=attachments_json)
         post_id = None
         if post:
             post_id = post.get('id') if isinstance(post, dict) else post
         
-        self.logic.set_user_state(user_id, "creating_meeting_description", state_data, post_id)
+        self.logic.set_wizard_state(user_id, "creating_meeting_description", state_data, post_id)
     
     async def ask_meeting_location(self, user_id: str, channel_id: str, state_data: Dict):
         """Попросить место встречи"""
         message = UIMessages.create_meeting_step_13()
         
-        attachments = [{
-            "fallback": "Location actions",
-            "actions": [
-                {
-                    "name": "Не добавлять",
-                    "type": "button",
-                    "integration": {
-                        "url": f"{Config.MM_ACTIONS_URL}/mattermost/actions",
-                        "context": {
-                            "action": "skip_location",
-                            "user_id": user_id,
-                        },
-                    },
-                },
-                {
-                    "name": "Отменить",
-                    "style": "danger",
-                    "type": "button",
-                    "integration": {
-                        "url": f"{Config.MM_ACTIONS_URL}/mattermost/actions",
-                        "context": {
-                            "action": ButtonActions.CANCEL_WIZARD,
-                            "user_id": user_id,
-                        },
-                    },
-                },
-            ],
-        }]
-        
-        post = await self.mm.create_post_with_attachments(channel_id, message, attachments)
+        attachments_json = _render(_LOCATION_ATTACHMENTS, user_id=user_id)
+
+        post = await self.mm.create_post_with_attachments(channel_id, message,
+                                                          attachments_json=attachments_json)
         post_id = None
         if post:
             post_id = post.get('id') if isinstance(post, dict) else post
         
-        self.logic.set_user_state(user_id, "creating_meeting_location", state_data, post_id)
+        self.logic.set_wizard_state(user_id, "creating_meeting_location", state_data, post_id)
     
     async def create_meeting(self, user_id: str, channel_id: str, state_data: Dict):
         """Создать встречу в календаре"""
@@ -605,21 +630,19 @@ class Bot:
                 await self.mm.send_message(channel_id, "Ошибка: не удалось распознать дату или время встречи")
                 return
 
-            # date_iso содержит локализованный datetime (с таймзоной), time_iso — время без TZ
-            start_date = datetime.fromisoformat(date_iso)
+            # date_iso содержит локализованный datetime (YYYY-MM-DD...), time_iso — время без TZ
             try:
+                start_day = _date.fromisoformat(date_iso[:10])
                 time_only = _time.fromisoformat(time_iso)
             except ValueError:
                 await self.mm.send_message(channel_id, "Ошибка: неверный формат времени встречи")
                 return
 
-            start = start_date.replace(hour=time_only.hour, minute=time_only.minute,
-                                       second=0, microsecond=0)
+            start = datetime(start_day.year, start_day.month, start_day.day,
+                             time_only.hour, time_only.minute, tzinfo=self.logic.tz)
             end = start + timedelta(minutes=int(duration_min))
 
-            from caldav_manager import CalDAVManager
-
-            caldav = CalDAVManager(user.email, self.logic.encryption.decrypt(user.encrypted_password))
+            caldav = self._get_caldav(user)
             created_ok = await caldav.create_event(
                 title=title,
                 start=start,
@@ -628,11 +651,11 @@ class Bot:
                 description=description,
                 location=location,
             )
-            await caldav.close()
 
             if not created_ok:
                 await self.mm.send_message(channel_id, "Не удалось создать встречу в календаре")
                 return
+            self.logic.invalidate_today_meetings(user_id)
 
             message = UIMessages.meeting_created(title,
                                                 start,
@@ -649,20 +672,39 @@ class Bot:
             logger.error(f"Error creating meeting: {e}")
             await self.mm.send_message(channel_id, "Ошибка при создании встречи")
 
+    def _get_caldav(self, user) -> CalDAVManager:
+        """Получить CalDAV-менеджер пользователя из пула BotLogic"""
+        return self.logic.get_caldav(user.mattermost_id, user.email,
+                                     self.logic.decrypt_user_password(user))
+
+    async def _evict_idle_caldav_loop(self):
+        """Периодически закрывать неиспользуемые CalDAV-сессии"""
+        while self.running:
+            await asyncio.sleep(60)
+            await self.logic.evict_idle_caldav()
+
+    async def _close_caldav_pool(self):
+        """Закрыть все CalDAV-сессии из пула"""
+        await self.logic.close_caldav_pool()
+
     def _next_schedule_tick(self, interval: int) -> float:
         """Рассчитать ближайший запуск с выравниванием по интервалу (секунды -> 00)."""
         now = time.time()
-        slot = int(now // interval) * interval
-        tolerance = 0.05
-        if now - slot > tolerance:
+        # Целочисленное выравнивание: interval — целое число секунд
+        slot = int(now) // interval * interval
+        if now - slot > 0.05:
             slot += interval
-        return slot
+        return float(slot)
 
-    async def _sleep_until(self, timestamp: float):
-        """Асинхронно дождаться заданного времени перед запуском задач."""
+    async def _wait_for_schedule(self, timestamp: float):
+        """Дождаться заданного времени или внеочередного изменения расписания."""
         delay = max(0.0, timestamp - time.time())
         if delay > 0:
-            await asyncio.sleep(delay)
+            try:
+                await asyncio.wait_for(self._schedule_wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+        self._schedule_wakeup.clear()
 
 
 if __name__ == "__main__":
@@ -1,153 +1,354 @@
 import asyncio
-from datetime import datetime, timedelta
-import json
+import logging
+from datetime import datetime, timedelta, time as dt_time
+import orjson
 import re
-from typing import Optional, List, Dict
-import pytz
+import time
+from typing import Optional, List, Dict, Tuple
+import msgpack
+from zoneinfo import ZoneInfo
 from dateutil.rrule import rruleset, rrulestr
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from config import Config
-from database import DatabaseManager, User, UserState, MeetingCache
+from database import (DatabaseManager, User, UserSnapshot, UserState, UserStateSnapshot,
+                      MeetingCache, TodayMeetingsCache)
 from encryption import EncryptionManager
 from mattermost_manager import MattermostManager
 from caldav_manager import CalDAVManager
 from ui_messages import UIMessages, ButtonActions, create_main_menu_buttons
 
+logger = logging.getLogger(__name__)
+
+try:
+    # C-парсер ISO 8601; без него — стандартный fromisoformat
+    from ciso8601 import parse_datetime as _parse_iso
+except ImportError:
+    _parse_iso = datetime.fromisoformat
+
+_TIME_RANGE_START_FMT = "%d.%m %H:%M"
+_TIME_RANGE_END_FMT = "%H:%M"
+
+_USERNAME_RE = re.compile(r'@(\w+)')
+_EMAIL_RE = re.compile(r'[\w\.-]+@[\w\.-]+\.\w+')
+
+_HIDDEN_STATUSES = frozenset({"CANCELLED"})
+
+_STATUS_LABELS = {
+    "ACCEPTED": "✅ Принято",
+    "DECLINED": "❌ Отклонено",
+    "TENTATIVE": "❓ Возможно",
+    "NEEDS-ACTION": "⏳ Ожидает",
+    "CONFIRMED": "✅ Подтверждено",
+    "CANCELLED": "🚫 Отменено",
+}
+
 
 class BotLogic:
     def __init__(self, db_manager: DatabaseManager, mm_manager: MattermostManager):
         self.db = db_manager
         self.mm = mm_manager
         self.encryption = EncryptionManager()
-        self.tz = pytz.timezone(Config.TZ)
+        self.tz = ZoneInfo(Config.TZ)
+        # Кэш списка пользователей для цикла уведомлений (сбрасывается при записи)
+        self._users_cache: Optional[List[UserSnapshot]] = None
+        self._users_loaded_at = 0.0
+        self._users_cache_ttl = 60.0
+        # mattermost_id -> (encrypted_password, расшифрованный пароль)
+        self._password_cache: Dict[str, tuple] = {}
+        # Данные мастера создания встречи: живут в памяти, в БД — только state/message_id
+        self._wizard_state: Dict[str, Dict] = {}
+        # (mattermost_id, дата) -> (время загрузки, встречи на сегодня)
+        self._today_cache: Dict[tuple, tuple] = {}
+        self._today_cache_ttl = 90.0
+        # Тот же снимок в БД — для холодного старта процесса
+        self._today_db_ttl = timedelta(minutes=2)
+        # (mattermost_id, дата) -> выполняющаяся загрузка встреч
+        self._today_inflight: Dict[tuple, asyncio.Future] = {}
+        # username -> (истекает, пользователь MM или None); промахи живут меньше
+        self._username_cache: Dict[str, tuple] = {}
+        self._username_cache_ttl = 3600.0
+        self._username_miss_ttl = 60.0
+        self._username_cache_size = 4096
+        # Пул CalDAV-менеджеров: mattermost_id -> (менеджер, время последнего использования)
+        self._caldav_pool: Dict[str, tuple] = {}
+        self._caldav_idle_timeout = 600
+        # Вытесненные из пула менеджеры (менеджер, время последнего использования):
+        # закрываются в evict_idle_caldav, когда ими точно никто не пользуется
+        self._retired_caldav: List[tuple] = []
+        # Не больше двух одновременных CalDAV-запросов на пользователя (rate limit сервера)
+        self._user_caldav_sems: Dict[str, asyncio.Semaphore] = {}
     
-    def get_user(self, mattermost_id: str) -> Optional[User]:
-        """Получить пользователя из БД"""
-        session = self.db.get_session()
-        try:
-            user = session.query(User).filter_by(mattermost_id=mattermost_id).first()
-            return user
-        finally:
-            session.close()
+    def get_user(self, mattermost_id: str) -> Optional[UserSnapshot]:
+        """Получить пользователя из БД (снимок нужных колонок, без ORM-сущности)"""
+        with self.db.session_scope() as session:
+            row = session.execute(
+                select(User.mattermost_id, User.email, User.encrypted_password)
+                .where(User.mattermost_id == mattermost_id)
+            ).first()
+        if row is None:
+            return None
+        return UserSnapshot(mattermost_id=row.mattermost_id, email=row.email,
+                            encrypted_password=row.encrypted_password)
     
     def create_user(self, mattermost_id: str, email: str, password: str) -> User:
         """Создать нового пользователя"""
-        session = self.db.get_session()
-        try:
-            encrypted_password = self.encryption.encrypt(password)
+        encrypted_password = self.encryption.encrypt(password)
+        with self.db.session_scope() as session:
             user = User(
                 mattermost_id=mattermost_id,
                 email=email,
                 encrypted_password=encrypted_password
             )
             session.add(user)
-            session.commit()
-            return user
-        finally:
-            session.close()
+        self._invalidate_users_cache()
+        self._password_cache.pop(mattermost_id, None)
+        return user
     
     def delete_user(self, mattermost_id: str) -> bool:
         """Удалить пользователя"""
-        session = self.db.get_session()
-        try:
-            user = session.query(User).filter_by(mattermost_id=mattermost_id).first()
-            if user:
-                session.delete(user)
-                session.commit()
-                return True
-            return False
-        finally:
-            session.close()
+        with self.db.session_scope() as session:
+            user = session.get(User, mattermost_id)
+            if not user:
+                return False
+            session.delete(user)
+        self._invalidate_users_cache()
+        self._password_cache.pop(mattermost_id, None)
+        self._drop_caldav(mattermost_id)
+        return True
+
+    def get_caldav(self, mattermost_id: str, email: str, password: str) -> CalDAVManager:
+        """CalDAV-менеджер пользователя из пула (keep-alive сессия переиспользуется)"""
+        now = time.monotonic()
+        entry = self._caldav_pool.get(mattermost_id)
+        if entry:
+            caldav, _ = entry
+            if caldav.email == email and caldav.password == password:
+                self._caldav_pool[mattermost_id] = (caldav, now)
+                return caldav
+            # Учётные данные сменились (перелогин) — старая сессия закроется, когда простоит таймаут
+            self._drop_caldav(mattermost_id)
+        caldav = CalDAVManager(email, password)
+        self._caldav_pool[mattermost_id] = (caldav, now)
+        return caldav
+
+    def _drop_caldav(self, mattermost_id: str):
+        # Не закрываем сразу: менеджер может быть занят get_events в другой корутине
+        entry = self._caldav_pool.pop(mattermost_id, None)
+        if entry:
+            self._retired_caldav.append(entry)
+
+    def has_caldav_sessions(self) -> bool:
+        return bool(self._caldav_pool or self._retired_caldav)
+
+    async def evict_idle_caldav(self):
+        """Закрыть CalDAV-сессии, не использовавшиеся дольше таймаута"""
+        deadline = time.monotonic() - self._caldav_idle_timeout
+        idle = [caldav for caldav, last_used in self._retired_caldav if last_used < deadline]
+        self._retired_caldav = [entry for entry in self._retired_caldav if entry[1] >= deadline]
+        for mattermost_id, (caldav, last_used) in list(self._caldav_pool.items()):
+            if last_used < deadline:
+                self._caldav_pool.pop(mattermost_id, None)
+                idle.append(caldav)
+        for caldav in idle:
+            try:
+                await caldav.close()
+            except Exception:
+                pass
+
+    async def close_caldav_pool(self):
+        """Закрыть все CalDAV-сессии из пула"""
+        pool, self._caldav_pool = self._caldav_pool, {}
+        retired, self._retired_caldav = self._retired_caldav, []
+        for caldav, _ in [*pool.values(), *retired]:
+            try:
+                await caldav.close()
+            except Exception:
+                pass
+
+    def get_users_snapshot(self, session=None) -> List[UserSnapshot]:
+        """Получить снимок всех пользователей (из кэша, если он актуален).
+
+        Можно передать долгоживущую сессию вызывающего; транзакция в ней
+        завершается после чтения, сама сессия не закрывается.
+        """
+        now = time.monotonic()
+        if self._users_cache is not None and now - self._users_loaded_at < self._users_cache_ttl:
+            return self._users_cache
+        stmt = select(User.mattermost_id, User.email, User.encrypted_password)
+        if session is None:
+            with self.db.session_scope() as own_session:
+                rows = own_session.execute(stmt).all()
+        else:
+            try:
+                rows = session.execute(stmt).all()
+            finally:
+                session.rollback()
+        self._users_cache = [
+            UserSnapshot(mattermost_id=row.mattermost_id, email=row.email,
+                         encrypted_password=row.encrypted_password)
+            for row in rows
+        ]
+        self._users_loaded_at = now
+        return self._users_cache
+
+    def decrypt_user_password(self, user) -> Optional[str]:
+        """Расшифровать пароль пользователя (с кэшем по шифротексту)"""
+        cached = self._password_cache.get(user.mattermost_id)
+        if cached and cached[0] == user.encrypted_password:
+            return cached[1]
+        password = self.encryption.decrypt(user.encrypted_password)
+        if password:
+            self._password_cache[user.mattermost_id] = (user.encrypted_password, password)
+        return password
+
+    def _invalidate_users_cache(self):
+        """Сбросить кэш пользователей после изменения таблицы users"""
+        self._users_cache = None
     
-    def get_user_state(self, mattermost_id: str) -> Optional[UserState]:
-        """Получить состояние пользователя"""
-        session = self.db.get_session()
-        try:
-            state = session.query(UserState).filter_by(mattermost_id=mattermost_id).first()
-            return state
-        finally:
-            session.close()
+    def get_user_state(self, mattermost_id: str) -> Optional[UserStateSnapshot]:
+        """Получить состояние пользователя (снимок, без ORM-сущности)"""
+        with self.db.session_scope() as session:
+            row = session.execute(
+                select(UserState.mattermost_id, UserState.state, UserState.data, UserState.message_id)
+                .where(UserState.mattermost_id == mattermost_id)
+            ).first()
+        if row is None:
+            return None
+        return UserStateSnapshot(mattermost_id=row.mattermost_id, state=row.state,
+                                 data=row.data, message_id=row.message_id)
     
     def set_user_state(self, mattermost_id: str, state: str, data: Dict = None, 
                       message_id: str = None):
         """Установить состояние пользователя"""
-        session = self.db.get_session()
-        try:
-            user_state = session.query(UserState).filter_by(mattermost_id=mattermost_id).first()
-            
-            if not user_state:
-                user_state = UserState(mattermost_id=mattermost_id)
-                session.add(user_state)
-            
-            user_state.state = state
-            if data:
-                user_state.data = json.dumps(data)
-            if message_id:
-                user_state.message_id = message_id
-            
-            session.commit()
-        finally:
-            session.close()
+        values = {'mattermost_id': mattermost_id, 'state': state}
+        if data:
+            values['data'] = msgpack.packb(data, use_bin_type=True)
+            self._wizard_state.pop(mattermost_id, None)
+        if message_id:
+            values['message_id'] = message_id
+        # Один INSERT ... ON CONFLICT DO UPDATE вместо SELECT + INSERT/UPDATE;
+        # не переданные data/message_id сохраняют прежние значения
+        stmt = sqlite_insert(UserState).values(**values)
+        update = {key: stmt.excluded[key] for key in values if key != 'mattermost_id'}
+        # onupdate столбца не применяется к ON CONFLICT DO UPDATE — задаём явно
+        update['updated_at'] = func.now()
+        stmt = stmt.on_conflict_do_update(index_elements=['mattermost_id'], set_=update)
+        with self.db.session_scope() as session:
+            session.execute(stmt)
+    
+    def set_wizard_state(self, mattermost_id: str, state: str, data: Dict,
+                         message_id: str = None):
+        """Шаг мастера: данные держим в памяти, в БД пишем только state/message_id"""
+        self._wizard_state[mattermost_id] = data
+        self.set_user_state(mattermost_id, state, message_id=message_id)
+
+    def flush_wizard_state(self):
+        """Сохранить незавершённые мастера в БД (при остановке бота)"""
+        if not self._wizard_state:
+            return
+        with self.db.session_scope() as session:
+            for mattermost_id, data in self._wizard_state.items():
+                user_state = session.get(UserState, mattermost_id)
+                if user_state:
+                    user_state.data = msgpack.packb(data, use_bin_type=True)
+
+    def get_state_data(self, user_state: Optional[UserStateSnapshot]) -> Dict:
+        """Распаковать данные состояния (msgpack; записи до миграции — JSON)"""
+        if user_state is None:
+            return {}
+        data = self._wizard_state.get(user_state.mattermost_id)
+        if data is not None:
+            return data
+        if not user_state.data:
+            return {}
+        raw = user_state.data
+        if isinstance(raw, str):
+            return orjson.loads(raw)
+        return msgpack.unpackb(raw, raw=False)
     
     def clear_user_state(self, mattermost_id: str):
         """Очистить состояние пользователя"""
-        session = self.db.get_session()
-        try:
-            user_state = session.query(UserState).filter_by(mattermost_id=mattermost_id).first()
-            if user_state:
-                session.delete(user_state)
-                session.commit()
-        finally:
-            session.close()
+        self._wizard_state.pop(mattermost_id, None)
+        with self.db.session_scope() as session:
+            session.execute(delete(UserState).where(UserState.mattermost_id == mattermost_id))
     
     async def get_today_meetings(self, mattermost_id: str, user_email: str, 
                                  password: str) -> List[Dict]:
-        """Получить все встречи на сегодня (async)"""
+        """Получить все встречи на сегодня (async, с коротким кэшем)"""
         tz_now = datetime.now(self.tz)
         start = tz_now.replace(hour=0, minute=0, second=0, microsecond=0)
         end = start + timedelta(days=1)
 
-        caldav = CalDAVManager(user_email, password)
+        cache_key = (mattermost_id, start.date())
+        cached = self._today_cache.get(cache_key)
+        if cached and time.monotonic() - cached[0] < self._today_cache_ttl:
+            return list(cached[1])
+        stored = self._load_today_meetings(mattermost_id, start.date())
+        if stored is not None:
+            meetings, age = stored
+            # Метка — момент загрузки из CalDAV, а не чтения строки: TTL не складываются
+            self._today_cache[cache_key] = (time.monotonic() - age, meetings)
+            return list(meetings)
+
+        # Single-flight: параллельные вызовы для того же ключа ждут один запрос к CalDAV
+        task = self._today_inflight.get(cache_key)
+        if task is None:
+            task = asyncio.ensure_future(
+                self._fetch_today_meetings(mattermost_id, user_email, password, tz_now, start, end)
+            )
+            self._today_inflight[cache_key] = task
+            task.add_done_callback(lambda _t, key=cache_key: self._today_inflight.pop(key, None))
+        # shield: отмена одного ожидающего не отменяет запрос для остальных
+        return list(await asyncio.shield(task))
+
+    async def _fetch_today_meetings(self, mattermost_id: str, user_email: str, password: str,
+                                    tz_now: datetime, start: datetime, end: datetime) -> List[Dict]:
+        """Загрузить и нормализовать встречи из CalDAV, обновив кэши"""
+        caldav = self.get_caldav(mattermost_id, user_email, password)
         events: List[Dict] = []
+        fetched = False
+        sem = self._user_caldav_sems.setdefault(mattermost_id, asyncio.Semaphore(2))
         try:
-            events = await caldav.get_events(start, end)
+            async with sem:
+                # Неудачный запрос не кэшируется как «встреч нет»
+                events, fetched = await caldav.get_events(start, end)
         except Exception:
             events = []
-        finally:
-            try:
-                await caldav.close()
-            except Exception:
-                pass
 
         events = self._expand_recurring_events(events, start, end)
 
         normalized: List[Dict] = []
-        # Диагностика количества сырых событий
-        try:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.info(f"Raw events fetched for {user_email}: count={len(events)} start={start.isoformat()} end={end.isoformat()}")
+        # Диагностика количества сырых событий (форматирование — только если уровень включён)
+        logger.info("Raw events fetched for %s: count=%d start=%s end=%s",
+                    user_email, len(events), start, end)
+        if logger.isEnabledFor(logging.INFO):
             for idx, evdbg in enumerate(events[:10]):
-                logger.info(f"Event[{idx}] uid={evdbg.get('uid')} title={evdbg.get('title')} start={evdbg.get('start_time')} end={evdbg.get('end_time')}")
-        except Exception:
-            pass
+                logger.info("Event[%d] uid=%s title=%s start=%s end=%s", idx, evdbg.get('uid'),
+                            evdbg.get('title'), evdbg.get('start_time'), evdbg.get('end_time'))
+        debug = logger.isEnabledFor(logging.DEBUG)
 
         for ev in events:
             try:
                 title = ev.get("title") or "Без названия"
                 start_iso = ev.get("start_time") or ""
                 end_iso = ev.get("end_time") or ""
-                start_dt = datetime.fromisoformat(start_iso) if start_iso else tz_now
-                end_dt = datetime.fromisoformat(end_iso) if end_iso else start_dt
-                time_str = f"{start_dt.strftime('%d.%m %H:%M')}–{end_dt.strftime('%H:%M')}"
-                status = ev.get("status") or "CONFIRMED"
+                start_dt = _parse_iso(start_iso) if start_iso else tz_now
+                end_dt = _parse_iso(end_iso) if end_iso else start_dt
+                time_str = f"{start_dt.strftime(_TIME_RANGE_START_FMT)}–{end_dt.strftime(_TIME_RANGE_END_FMT)}"
+                # Статус приводим к верхнему регистру один раз — дальше сравнения без upper()
+                status = (ev.get("status") or "CONFIRMED").upper()
                 # Исключаем отменённые встречи из списка
-                if status.upper() == "CANCELLED":
+                if status in _HIDDEN_STATUSES:
                     continue
                 normalized.append({
                     "uid": ev.get("uid", ""),
                     "title": title,
                     "start_time": start_dt.isoformat(),
                     "end_time": end_dt.isoformat(),
+                    # Уже разобранные значения, чтобы не парсить ISO повторно
+                    "_start_dt": start_dt,
+                    "_end_dt": end_dt,
                     "time": time_str,
                     "status": status,
                     "attendees": ev.get("attendees", []),
@@ -155,20 +356,71 @@ class BotLogic:
                     "location": ev.get("location", ""),
                     "organizer": ev.get("organizer", ""),
                 })
-                try:
-                    logger.debug(
-                        f"Normalize uid={ev.get('uid')} title='{title}' start_raw='{start_iso}' end_raw='{end_iso}' start_parsed={start_dt} end_parsed={end_dt}"
-                    )
-                except Exception:
-                    pass
+                if debug:
+                    logger.debug("Normalize uid=%s title='%s' start_raw='%s' end_raw='%s' start_parsed=%s end_parsed=%s",
+                                 ev.get('uid'), title, start_iso, end_iso, start_dt, end_dt)
             except Exception:
                 continue
-        try:
-            logger.info(f"Normalized events for {user_email}: count={len(normalized)}")
-        except Exception:
-            pass
-        normalized.sort(key=lambda item: self._safe_parse_time_key(item.get("start_time")))
+        logger.info("Normalized events for %s: count=%d", user_email, len(normalized))
+        normalized.sort(key=lambda item: self._time_key(item["_start_dt"]))
+        if fetched:
+            # Записи за прошлые дни больше не нужны
+            self._drop_today_memory(mattermost_id)
+            self._today_cache[(mattermost_id, start.date())] = (time.monotonic(), normalized)
+            try:
+                self._store_today_meetings(mattermost_id, start.date(), normalized)
+            except Exception as e:
+                logger.error(f"Failed to store today meetings for {mattermost_id}: {e}")
         return normalized
+
+    def invalidate_today_meetings(self, mattermost_id: str):
+        """Сбросить кэш встреч пользователя (после создания или изменения встреч)"""
+        self._drop_today_memory(mattermost_id)
+        with self.db.session_scope() as session:
+            session.execute(delete(TodayMeetingsCache).where(TodayMeetingsCache.user_id == mattermost_id))
+
+    def _drop_today_memory(self, mattermost_id: str):
+        for key in [k for k in self._today_cache if k[0] == mattermost_id]:
+            self._today_cache.pop(key, None)
+
+    def _load_today_meetings(self, mattermost_id: str, day) -> Optional[Tuple[List[Dict], float]]:
+        """Свежий снимок встреч из БД и его возраст в секундах, или None"""
+        now = datetime.utcnow()
+        with self.db.session_scope() as session:
+            row = session.execute(
+                select(TodayMeetingsCache.payload, TodayMeetingsCache.fetched_at).where(
+                    TodayMeetingsCache.user_id == mattermost_id,
+                    TodayMeetingsCache.day == day,
+                    TodayMeetingsCache.fetched_at > now - self._today_db_ttl,
+                )
+            ).first()
+        if row is None:
+            return None
+        meetings = msgpack.unpackb(row.payload, raw=False)
+        for meeting in meetings:
+            meeting["_start_dt"] = _parse_iso(meeting["start_time"])
+            meeting["_end_dt"] = _parse_iso(meeting["end_time"])
+        return meetings, max(0.0, (now - row.fetched_at).total_seconds())
+
+    def _store_today_meetings(self, mattermost_id: str, day, meetings: List[Dict]):
+        """Записать снимок встреч на день одной строкой (старые дни удаляются)"""
+        payload = msgpack.packb(
+            [{k: v for k, v in m.items() if not k.startswith("_")} for m in meetings],
+            use_bin_type=True,
+        )
+        now = datetime.utcnow()
+        stmt = sqlite_insert(TodayMeetingsCache).values(
+            user_id=mattermost_id, day=day, payload=payload, fetched_at=now
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'day'],
+            set_={'payload': stmt.excluded.payload, 'fetched_at': stmt.excluded.fetched_at},
+        )
+        with self.db.session_scope() as session:
+            session.execute(delete(TodayMeetingsCache).where(
+                TodayMeetingsCache.user_id == mattermost_id, TodayMeetingsCache.day != day
+            ))
+            session.execute(stmt)
     
     async def get_current_meetings(self, mattermost_id: str, user_email: str,
                                    password: str) -> List[Dict]:
@@ -176,74 +428,76 @@ class BotLogic:
         all_today = await self.get_today_meetings(mattermost_id, user_email, password)
         now = datetime.now(self.tz)
         result: List[Dict] = []
+        # all_today уже отсортирован и без отменённых встреч
         for m in all_today:
             try:
-                start_dt = datetime.fromisoformat(m["start_time"])
-                end_dt = datetime.fromisoformat(m["end_time"])
-                status = (m.get("status") or "").upper()
-                # Исключаем отменённые встречи
-                if end_dt >= now and status != "CANCELLED":
+                if m["_end_dt"] >= now:
                     result.append(m)
-            except Exception:
+            except TypeError:
+                # Время без TZ (например, весь день) сравнивать с now нельзя
                 continue
-        result.sort(key=lambda item: self._safe_parse_time_key(item.get("start_time")))
         return result
     
     def format_meetings_table(self, meetings: List[Dict]) -> str:
         """Форматировать встречи в таблицу"""
         if not meetings:
             return "Встреч не найдено"
-        status_map = {
-            "ACCEPTED": "✅ Принято",
-            "DECLINED": "❌ Отклонено",
-            "TENTATIVE": "❓ Возможно",
-            "NEEDS-ACTION": "⏳ Ожидает",
-            "CONFIRMED": "✅ Подтверждено",
-            "CANCELLED": "🚫 Отменено",
-        }
-        table = "| Встреча | Время | Статус |\n|---------|-------|--------|\n"
+        rows = ["| Встреча | Время | Статус |", "|---------|-------|--------|"]
         for meeting in meetings:
-            title = meeting.get('title', 'Без названия')
-            time_str = meeting.get('time', '')
-            raw_status = (meeting.get('status', 'ACCEPTED') or '').strip().upper()
-            status = status_map.get(raw_status, raw_status or '—')
-            table += f"| {title} | {time_str} | {status} |\n"
-        
-        return table
+            # status уже канонизирован в get_today_meetings
+            raw_status = meeting.get('status', 'ACCEPTED')
+            status = _STATUS_LABELS.get(raw_status, raw_status or '—')
+            rows.append(f"| {meeting.get('title', 'Без названия')} | {meeting.get('time', '')} | {status} |")
+        rows.append("")
+        return "\n".join(rows)
     
     async def parse_attendees(self, text: str) -> List[str]:
         """Парсить список участников (@username и emails)"""
-        attendees = []
-        
-        # Найти все @username
-        usernames = re.findall(r'@(\w+)', text)
-        for username in usernames:
-            user = await self.mm.get_user_by_username(username)
-            if user and user.get('email'):
-                attendees.append(user['email'])
+        # Найти все @username (каждый запрашиваем один раз, параллельно)
+        usernames = list(dict.fromkeys(_USERNAME_RE.findall(text)))
+        users = await asyncio.gather(*(self._lookup_username(u) for u in usernames))
+        attendees = [user['email'] for user in users if user and user.get('email')]
         
         # Найти все email адреса
-        emails = re.findall(r'[\w\.-]+@[\w\.-]+\.\w+', text)
-        attendees.extend(emails)
+        attendees.extend(_EMAIL_RE.findall(text))
         
-        # Удалить дубликаты
-        return list(set(attendees))
+        # Удалить дубликаты, сохранив порядок
+        return list(dict.fromkeys(attendees))
+    
+    async def _lookup_username(self, username: str) -> Optional[Dict]:
+        """Пользователь Mattermost по username (с TTL-кэшем)"""
+        now = time.monotonic()
+        cached = self._username_cache.get(username)
+        if cached and cached[0] > now:
+            return cached[1]
+        user = await self.mm.get_user_by_username(username)
+        if len(self._username_cache) >= self._username_cache_size:
+            self._username_cache = {k: v for k, v in self._username_cache.items() if v[0] > now}
+            if len(self._username_cache) >= self._username_cache_size:
+                self._username_cache.clear()
+        ttl = self._username_cache_ttl if user else self._username_miss_ttl
+        self._username_cache[username] = (now + ttl, user)
+        return user
     
     def validate_date(self, date_str: str) -> Optional[datetime]:
         """Валидировать дату в формате DD.MM.YYYY"""
         try:
-            dt = datetime.strptime(date_str, "%d.%m.%Y")
-            # Конвертировать в текущий timezone
-            return self.tz.localize(dt)
-        except:
+            day, month, year = date_str.split(".")
+            # Строго DD.MM.YYYY, как strptime("%d.%m.%Y") раньше
+            if not (len(day) == len(month) == 2 and len(year) == 4
+                    and (day + month + year).isdigit()):
+                return None
+            # Сразу в текущем timezone
+            return datetime(int(year), int(month), int(day), tzinfo=self.tz)
+        except (ValueError, AttributeError):
             return None
     
-    def validate_time(self, time_str: str) -> Optional[timedelta]:
+    def validate_time(self, time_str: str) -> Optional[dt_time]:
         """Валидировать время в формате HH:MM"""
         try:
-            time_obj = datetime.strptime(time_str, "%H:%M").time()
-            return time_obj
-        except:
+            hour, minute = time_str.split(":")
+            return dt_time(int(hour), int(minute))
+        except (ValueError, AttributeError):
             return None
     
     def validate_minutes(self, minutes_str: str) -> Optional[int]:
@@ -333,16 +587,13 @@ class BotLogic:
 
     def _ensure_local_tz(self, dt_obj: datetime) -> datetime:
         if dt_obj.tzinfo is None:
-            return self.tz.localize(dt_obj)
+            return dt_obj.replace(tzinfo=self.tz)
         return dt_obj.astimezone(self.tz)
 
-    def _safe_parse_time_key(self, value: Optional[str]) -> float:
+    def _time_key(self, dt_obj: datetime) -> float:
         try:
-            if not value:
-                return float("inf")
-            dt_obj = datetime.fromisoformat(value)
             if dt_obj.tzinfo is None:
-                dt_obj = self.tz.localize(dt_obj)
+                dt_obj = dt_obj.replace(tzinfo=self.tz)
             else:
                 dt_obj = dt_obj.astimezone(self.tz)
             return dt_obj.timestamp()
@@ -1,32 +1,476 @@
+import asyncio
 import aiohttp
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
-import pytz
 from config import Config
-import json
 import hashlib
 import logging
-import vobject
+import multiprocessing
+import os
+import re
+import threading
+import time
 import uuid
+from collections import OrderedDict
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from zoneinfo import ZoneInfo
 
 logger = logging.getLogger(__name__)
 
+# Часовые пояса создаются один раз; zoneinfo не требует localize()
+_TZ = ZoneInfo(Config.TZ)
+_UTC = ZoneInfo("UTC")
+
+# Регулярные выражения и таблицы translate разбора/сборки iCalendar — компилируются один раз
+# Разворачивание строк и удаление управляющих символов (кроме \t, \n, \r)
+_UNFOLD_RE = re.compile(r'\r?\n[ \t]')
+_CTRL_TABLE = {c: None for c in range(32) if c not in (9, 10, 13)}
+# Очистка адресов участников/организатора: переводы строк
+_WS_TABLE = str.maketrans('', '', '\r\n\t')
+# Экранирование TEXT-значений iCalendar (RFC 5545, 3.3.11)
+_ICS_ESCAPE = str.maketrans({"\\": "\\\\", ";": "\\;", ",": "\\,", "\n": "\\n", "\r": None})
+# Относительный TRIGGER VALARM: [+-]PT[nH][nM][nS]
+_TRIGGER_RE = re.compile(r'^([+-]?)PT(?=\d)(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?$')
+
 try:
     from icalendar import Calendar, Event, Alarm
 except ImportError:
     Calendar = Event = Alarm = None
 
+try:
+    # C-парсер XML; без него — стандартный ElementTree (тот же API find/findall)
+    from lxml import etree as ET
+except ImportError:
+    from xml.etree import ElementTree as ET
+
+
+@lru_cache(maxsize=64)
+def _get_tz(tzid: str) -> ZoneInfo:
+    """ZoneInfo по TZID; неизвестные (например, Windows-имена) -> _TZ.
+
+    Кэшируется и неудачный поиск: ZoneInfo не запоминает ошибки и каждый раз ищет файл зоны.
+    """
+    if not tzid:
+        return _TZ
+    try:
+        return ZoneInfo(tzid)
+    except Exception:
+        return _TZ
+
+
+def _to_local(value) -> datetime:
+    """date / naive / aware -> aware datetime в _TZ (без пересчёта, если зона уже та же)"""
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, datetime.min.time())
+    tzinfo = value.tzinfo
+    if tzinfo is None:
+        return value.replace(tzinfo=_TZ)
+    if tzinfo is _TZ:
+        # icalendar отдаёт ZoneInfo из общего кэша — для TZID=Config.TZ это тот же объект
+        return value
+    return value.astimezone(_TZ)
+
+
+def _clean_addr(value) -> str:
+    """'MAILTO:user@x\r\n' -> 'user@x' (первое слово без префикса mailto:)"""
+    addr = str(value).lstrip()
+    # Префикс сверяется срезом: в нижний регистр переводятся только 7 символов
+    if addr[:7].lower() == "mailto:":
+        addr = addr[7:]
+    # split(None, 1) отбрасывает ведущие пробелы сам — без отдельного strip()
+    words = addr.translate(_WS_TABLE).split(None, 1)
+    return words[0] if words else ''
+
+
+def _vevent_to_dict(component) -> Dict:
+    """VEVENT (icalendar) -> словарь события, свойства читаются по одному разу.
+
+    Общий для разбора REPORT и python-caldav fallback.
+    """
+    # Component — dict с ключами в верхнем регистре; dict.get минует регистронезависимый поиск
+    get = dict.get
+    raw_start = get(component, "DTSTART").dt
+    raw_end = get(component, "DTEND")
+    if raw_end is not None:
+        raw_end = raw_end.dt
+    else:
+        # RFC 5545, 3.6.1: без DTEND — DURATION, иначе сутки для даты и ноль для времени
+        duration = get(component, "DURATION")
+        if duration is not None:
+            raw_end = raw_start + duration.dt
+        elif isinstance(raw_start, datetime):
+            raw_end = raw_start
+        else:
+            raw_end = raw_start + timedelta(days=1)
+    dtstart = _to_local(raw_start)
+    dtend = _to_local(raw_end)
+
+    raw_attendees = get(component, "ATTENDEE") or []
+    if not isinstance(raw_attendees, list):
+        raw_attendees = [raw_attendees]
+    attendees = [addr for addr in map(_clean_addr, raw_attendees) if addr]
+    organizer = get(component, "ORGANIZER")
+
+    rrule_text = ""
+    rrule_raw = get(component, "RRULE")
+    if rrule_raw:
+        try:
+            rrule_text = rrule_raw.to_ical().decode()
+        except Exception:
+            rrule_text = str(rrule_raw)
+
+    exdates: List[str] = []
+    exdate_props = get(component, "EXDATE") or []
+    if not isinstance(exdate_props, list):
+        exdate_props = [exdate_props]
+    for ex_prop in exdate_props:
+        try:
+            for dt_entry in getattr(ex_prop, 'dts', None) or ():
+                exdates.append(_to_local(getattr(dt_entry, 'dt', dt_entry)).isoformat())
+        except Exception:
+            continue
+
+    alarms: List[str] = []
+    # VALARM — прямые дочерние компоненты VEVENT (RFC 5545), рекурсивный walk() не нужен
+    for subcomp in component.subcomponents:
+        if subcomp.name != "VALARM":
+            continue
+        trigger = subcomp.get("trigger")
+        if not trigger:
+            continue
+        try:
+            # TRIGGER: абсолютное время или смещение от начала (-PT15M)
+            value = trigger.dt if hasattr(trigger, 'dt') else getattr(trigger, 'td', None)
+            if isinstance(value, datetime):
+                alarms.append(_to_local(value).isoformat())
+            elif isinstance(value, timedelta):
+                alarms.append((dtstart + value).isoformat())
+        except Exception as alarm_err:
+            logger.debug(f"Failed to parse VALARM trigger: {alarm_err}")
+
+    return {
+        "uid": str(get(component, "UID", "")),
+        "title": str(get(component, "SUMMARY", "Без названия")),
+        "start_time": dtstart.isoformat(),
+        "end_time": dtend.isoformat(),
+        "attendees": attendees,
+        "description": str(get(component, "DESCRIPTION", "")),
+        "location": str(get(component, "LOCATION", "")),
+        "organizer": _clean_addr(organizer) if organizer else "",
+        "status": str(get(component, "STATUS", "CONFIRMED")),
+        "alarms": alarms,
+        "rrule": rrule_text,
+        "exdate": exdates,
+    }
+
+
+def _parse_ical_dt(value: str) -> Optional[datetime]:
+    """'YYYYMMDDTHHMM[SS][Z]' -> naive datetime срезами строки (None для других форматов)"""
+    if value.endswith('Z'):
+        value = value[:-1]
+    size = len(value)
+    if (size != 15 and size != 13) or value[8] != 'T' or not (value[:8].isdigit() and value[9:].isdigit()):
+        return None
+    try:
+        return datetime(int(value[0:4]), int(value[4:6]), int(value[6:8]),
+                        int(value[9:11]), int(value[11:13]), int(value[13:15]) if size == 15 else 0)
+    except ValueError:
+        return None
+
+
+def _param_tzid(params: str) -> str:
+    """TZID из параметров свойства ('TZID=Europe/Moscow;VALUE=...')"""
+    for param in params.split(';'):
+        if param.startswith("TZID="):
+            return param[5:]
+    return ""
+
+
+def _scan_vevents(ical_blocks: List[str]) -> List[Dict]:
+    """Запасной разбор VEVENT без icalendar: один проход по строкам блока.
+
+    Строки раскладываются по имени свойства; внутри VALARM берётся только TRIGGER.
+    """
+    events: List[Dict] = []
+    for ib_idx, block in enumerate(ical_blocks):
+        props = None
+        for line in block.splitlines():
+            line = line.rstrip()
+            if props is None:
+                if line == "BEGIN:VEVENT":
+                    props, attendees, exdates, triggers = {}, [], [], []
+                    in_valarm = False
+                continue
+            if in_valarm:
+                if line == "END:VALARM":
+                    in_valarm = False
+                elif not alarm_trigger and line.startswith("TRIGGER"):
+                    alarm_trigger = line.partition(":")[2].strip()
+                    triggers.append(alarm_trigger)
+                continue
+            if line == "BEGIN:VALARM":
+                in_valarm, alarm_trigger = True, ""
+                continue
+            if line == "END:VEVENT":
+                event = _fallback_event(props, attendees, exdates, triggers,
+                                        f"fallback-{ib_idx}-{len(events)}")
+                if event:
+                    events.append(event)
+                props = None
+                continue
+            head, sep, value = line.partition(":")
+            if not sep:
+                continue
+            name, _, params = head.partition(";")
+            if name == "ATTENDEE":
+                if value[:7].lower() == "mailto:":
+                    attendees.append(value)
+            elif name == "EXDATE":
+                exdates.append((_param_tzid(params), value))
+            elif name not in props:
+                props[name] = (params, value.strip())
+    return events
+
+
+def _fallback_event(props: Dict, attendees: List[str], exdate_lines: List[Tuple[str, str]],
+                    triggers: List[str], default_uid: str) -> Optional[Dict]:
+    """Словарь события из строковых свойств VEVENT (без DTSTART/DTEND — None)"""
+    def prop(name: str) -> str:
+        return props.get(name, ("", ""))[1]
+
+    def prop_dt(name: str) -> Optional[datetime]:
+        params, raw = props.get(name, ("", ""))
+        if not raw:
+            return None
+        parsed = _parse_ical_dt(raw)
+        if parsed is None:
+            return None
+        if raw.endswith('Z'):
+            return parsed.replace(tzinfo=_UTC)
+        return parsed.replace(tzinfo=_get_tz(_param_tzid(params)))
+
+    dtstart = prop_dt("DTSTART")
+    dtend = prop_dt("DTEND")
+    if not (dtstart and dtend):
+        return None
+
+    emails = [addr for addr in map(_clean_addr, attendees) if addr]
+    organizer = prop("ORGANIZER")
+    if organizer[:7].lower() != "mailto:":
+        organizer = ""
+
+    exdates: List[str] = []
+    for ex_tzid, ex_line in exdate_lines:
+        for ex_val in ex_line.split(','):
+            ex_val = ex_val.strip()
+            if not ex_val:
+                continue
+            ex_dt = _parse_ical_dt(ex_val)
+            if ex_dt is None:
+                continue
+            ex_dt = ex_dt.replace(tzinfo=_UTC if ex_val.endswith('Z') else _get_tz(ex_tzid))
+            exdates.append(ex_dt.isoformat())
+
+    alarms: List[str] = []
+    for trigger_val in triggers:
+        # Смещение от начала события (-PT15M, PT1H30M)
+        m = _TRIGGER_RE.match(trigger_val)
+        if not m:
+            continue
+        sign, hours, minutes, seconds = m.groups()
+        delta = timedelta(hours=int(hours or 0), minutes=int(minutes or 0), seconds=int(seconds or 0))
+        if sign == "-":
+            delta = -delta
+        alarms.append((dtstart + delta).isoformat())
+
+    return {
+        "uid": prop("UID") or default_uid,
+        "title": prop("SUMMARY") or "Без названия",
+        "start_time": dtstart.isoformat(),
+        "end_time": dtend.isoformat(),
+        "attendees": emails,
+        "description": prop("DESCRIPTION"),
+        "location": prop("LOCATION"),
+        "organizer": _clean_addr(organizer) if organizer else "",
+        "status": prop("STATUS") or "CONFIRMED",
+        "alarms": alarms,
+        "rrule": prop("RRULE"),
+        "exdate": exdates,
+    }
+
+
+def _ics_escape(text: str) -> str:
+    return text.translate(_ICS_ESCAPE)
+
+
+def _ics_fold(line: str) -> str:
+    """Свернуть строку контента по 75 октетов (RFC 5545, 3.1)"""
+    if len(line.encode('utf-8')) <= 75:
+        return line + "\r\n"
+    parts = []
+    chunk = ""
+    size = 0
+    limit = 75
+    for ch in line:
+        n = len(ch.encode('utf-8'))
+        if size + n > limit:
+            parts.append(chunk)
+            # Строка продолжения начинается с пробела
+            chunk, size, limit = "", 0, 74
+        chunk += ch
+        size += n
+    parts.append(chunk)
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _xml_bytes(body) -> bytes:
+    """Тело ответа как bytes: парсер сам читает кодировку из XML-объявления"""
+    return body.encode('utf-8') if isinstance(body, str) else body
+
+
+def _xml_root(body):
+    """Разобрать XML-ответ (bytes; str кодируется в UTF-8)"""
+    return ET.fromstring(_xml_bytes(body))
+
+
+# Пространства имён и селекторы multistatus компилируются один раз при импорте
+_NS = {"d": "DAV:", "c": "urn:ietf:params:xml:ns:caldav"}
+
+if hasattr(ET, "XPath"):
+    _XP_RESPONSE = ET.XPath("d:response", namespaces=_NS)
+    _XP_HREF = ET.XPath("d:href/text()", namespaces=_NS)
+    _XP_CAL = ET.XPath("d:propstat/d:prop/d:resourcetype/c:calendar", namespaces=_NS)
+    _XP_DISPLAYNAME = ET.XPath("d:propstat/d:prop/d:displayname/text()", namespaces=_NS)
+else:
+    def _xp_texts(path: str):
+        return lambda el: [e.text for e in el.findall(path, _NS) if e.text]
+
+    def _xp_elements(path: str):
+        return lambda el: el.findall(path, _NS)
+
+    _XP_RESPONSE = _xp_elements("d:response")
+    _XP_HREF = _xp_texts("d:href")
+    _XP_CAL = _xp_elements("d:propstat/d:prop/d:resourcetype/c:calendar")
+    _XP_DISPLAYNAME = _xp_texts("d:propstat/d:prop/d:displayname")
+
+
+_TAG_RESPONSE = "{DAV:}response"
+_TAG_HREF = "{DAV:}href"
+_TAG_ETAG = "{DAV:}getetag"
+_TAG_CALDATA = "{urn:ietf:params:xml:ns:caldav}calendar-data"
+
+
+class _CalendarDataPuller:
+    """Инкрементальный разбор REPORT-ответа: feed() по мере прихода байтов.
+
+    Возвращает готовые (href, etag, calendar-data); разобранные d:response сразу очищаются,
+    поэтому в памяти не держится ни всё тело ответа, ни всё дерево.
+    """
+
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=("end",))
+        self._href = self._etag = ""
+        self._blocks: List[str] = []
+
+    def feed(self, chunk: bytes) -> List[Tuple[str, str, str]]:
+        self._parser.feed(chunk)
+        return self._drain()
+
+    def close(self) -> List[Tuple[str, str, str]]:
+        self._parser.close()
+        return self._drain()
+
+    def _drain(self) -> List[Tuple[str, str, str]]:
+        ready: List[Tuple[str, str, str]] = []
+        for _, elem in self._parser.read_events():
+            tag = elem.tag
+            if tag == _TAG_CALDATA:
+                if elem.text:
+                    # Полный текст, включая возможные дополнительные text nodes
+                    self._blocks.append(''.join(elem.itertext()))
+            elif tag == _TAG_HREF:
+                self._href = (elem.text or "").strip()
+            elif tag == _TAG_ETAG:
+                self._etag = (elem.text or "").strip()
+            elif tag == _TAG_RESPONSE:
+                ready.extend((self._href, self._etag, block) for block in self._blocks)
+                self._href = self._etag = ""
+                self._blocks = []
+                elem.clear()
+                if hasattr(elem, "getprevious"):
+                    # lxml: убрать уже обработанные соседние узлы из корня
+                    while elem.getprevious() is not None:
+                        del elem.getparent()[0]
+        return ready
+
+
+# Размер порции при потоковом чтении REPORT
+_REPORT_CHUNK = 64 * 1024
+
+
+# Разобранные события по (href, etag) ресурса: неизменённые ресурсы не парсятся заново.
+# Текст calendar-data сверяется целиком — с C:expand он зависит ещё и от диапазона запроса.
+_PARSED_CACHE_MAX = 2048
+_parsed_cache: "OrderedDict[Tuple[str, str], Tuple[str, List[Dict]]]" = OrderedDict()
+# Разбор идёт и в event loop, и в потоках asyncio.to_thread
+_parsed_cache_lock = threading.Lock()
+
+
+def _propfind_entries(root):
+    """(href, displayname, is_calendar) для каждого d:response PROPFIND-ответа"""
+    for response in _XP_RESPONSE(root):
+        hrefs = _XP_HREF(response)
+        names = _XP_DISPLAYNAME(response)
+        href = hrefs[0].strip() if hrefs else ""
+        displayname = names[0].strip() if names else ""
+        yield href, displayname, bool(_XP_CAL(response))
+
+
+# Разбор REPORT-ответов (XML + ICS): мелкие — inline, средние — в потоке,
+# большие — в отдельных процессах, чтобы не блокировать loop
+_PARSE_THREAD_MIN = 4 * 1024
+_PARSE_OFFLOAD_MIN = 64 * 1024
+_parse_pool: Optional[ProcessPoolExecutor] = None
+_parse_sem = asyncio.Semaphore(os.cpu_count() or 1)
+
+
+def _get_parse_pool() -> ProcessPoolExecutor:
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1,
+                                          mp_context=multiprocessing.get_context("spawn"))
+    return _parse_pool
+
+
+def shutdown_parse_pool():
+    """Остановить пул процессов разбора (при остановке бота)"""
+    global _parse_pool
+    pool, _parse_pool = _parse_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
 
 class CalDAVManager:
+    # Имена основного календаря (Mail.ru), в нижнем регистре
+    _PREFERRED_NAMES = frozenset(("main", "основной"))
+    # Поля события, от которых зависит hash_event (строковые и списочные)
+    _HASH_FIELDS = ("uid", "title", "start_time", "end_time", "description",
+                    "location", "organizer", "status", "rrule")
+    _HASH_LIST_FIELDS = ("attendees", "alarms", "exdate")
+
     def __init__(self, email: str, password: str):
         self.email = email
         self.password = password
         self.base_url = Config.CALDAV_BASE_URL
+        self._base = self.base_url.rstrip('/')
         self.principal_url = self._build_principal_url(email)
         self.session = None
         self.calendar_path = None
-        self.last_events_ok = True
-        self.last_events_statuses: List[int] = []
+        # Найденные календари (PROPFIND-обнаружение) с TTL
+        self._calendars_cache: Optional[List[Dict[str, str]]] = None
+        self._calendars_cache_ts: float = 0.0
+        self._calendars_cache_ttl = 300
     
     def _build_principal_url(self, email: str) -> str:
         """Построить URL principal для Mail.ru CalDAV"""
@@ -38,11 +482,21 @@ class CalDAVManager:
         except:
             return f"{self.base_url}{Config.CALDAV_PRINCIPAL_PATH}"
     
+    def _abs_url(self, href: str) -> str:
+        """Относительный href сервера -> абсолютный URL"""
+        return self._base + href if href.startswith('/') else href
+
     async def _get_session(self) -> aiohttp.ClientSession:
         """Получить или создать сессию"""
-        if self.session is None:
+        if self.session is None or self.session.closed:
+            # Keep-alive пул: параллельные REPORT/PROPFIND переиспользуют TLS-соединения
+            connector = aiohttp.TCPConnector(limit=32, limit_per_host=8, keepalive_timeout=60,
+                                             ttl_dns_cache=300, enable_cleanup_closed=True)
             self.session = aiohttp.ClientSession(
-                auth=aiohttp.BasicAuth(self.email, self.password)
+                auth=aiohttp.BasicAuth(self.email, self.password),
+                connector=connector,
+                # Лимиты на соединение и паузу чтения; total щедрый — потоковые REPORT бывают долгими
+                timeout=aiohttp.ClientTimeout(total=300, sock_connect=10, sock_read=60),
             )
         return self.session
     
@@ -64,6 +518,20 @@ class CalDAVManager:
             return False
     
     async def get_calendars(self) -> List[Dict[str, str]]:
+        """Получить список календарей (кэш на _calendars_cache_ttl секунд)"""
+        if self._calendars_cache and time.monotonic() - self._calendars_cache_ts < self._calendars_cache_ttl:
+            return self._calendars_cache
+        calendars = await self._discover_calendars()
+        if calendars:
+            self._calendars_cache = calendars
+            self._calendars_cache_ts = time.monotonic()
+        return calendars
+
+    def invalidate_calendars(self):
+        """Сбросить кэш календарей (следующий запрос заново выполнит PROPFIND)"""
+        self._calendars_cache = None
+
+    async def _discover_calendars(self) -> List[Dict[str, str]]:
         """Получить список календарей (enumeration + fallback)."""
         try:
             session = await self._get_session()
@@ -73,30 +541,17 @@ class CalDAVManager:
             # Первый проход: principal URL
             try:
                 async with session.request("PROPFIND", self.principal_url, headers=headers) as resp:
-                    text = await resp.text()
+                    text = await resp.read()
                     status = resp.status
                     logger.info(f"Principal PROPFIND status={status} url={self.principal_url}")
                     if status in (200, 207):
-                        from xml.etree import ElementTree as ET
-                        ns = {"d": "DAV:", "c": "urn:ietf:params:xml:ns:caldav"}
                         try:
-                            root = ET.fromstring(text)
-                            for response in root.findall("d:response", ns):
-                                href_el = response.find("d:href", ns)
-                                propstat = response.find("d:propstat", ns)
-                                if href_el is None or propstat is None:
-                                    continue
-                                prop = propstat.find("d:prop", ns)
-                                if prop is None:
-                                    continue
-                                rtype = prop.find("d:resourcetype", ns)
-                                displayname_el = prop.find("d:displayname", ns)
-                                displayname = displayname_el.text.strip() if displayname_el is not None and displayname_el.text else ""
-                                href = href_el.text.strip() if href_el.text else ""
+                            for href, displayname, is_calendar in _propfind_entries(_xml_root(text)):
                                 if href.endswith('/calendars/'):
                                     calendars_root_href = href
-                                if rtype is not None and rtype.find("c:calendar", ns) is not None and href:
-                                    calendars.append({"href": href if href.endswith('/') else href + '/', "name": displayname or "Calendar"})
+                                if is_calendar and href:
+                                    full_href = href if href.endswith('/') else href + '/'
+                                    calendars.append({"href": self._abs_url(full_href), "name": displayname or "Calendar"})
                         except Exception as e:
                             logger.info(f"Failed to parse principal PROPFIND XML: {e}")
             except Exception as e:
@@ -104,46 +559,26 @@ class CalDAVManager:
 
             # Второй проход: перечисление внутри /calendars/
             if calendars_root_href and not calendars:
-                if calendars_root_href.startswith('/'):
-                    calendars_root_url = self.base_url.rstrip('/') + calendars_root_href
-                else:
-                    calendars_root_url = calendars_root_href
+                calendars_root_url = self._abs_url(calendars_root_href)
                 logger.info(f"Enumerating calendars at {calendars_root_url}")
                 try:
                     async with session.request("PROPFIND", calendars_root_url, headers=headers) as resp2:
-                        text2 = await resp2.text()
+                        text2 = await resp2.read()
                         status2 = resp2.status
                         logger.info(f"Calendars collection PROPFIND status={status2}")
                         if status2 in (200, 207):
-                            from xml.etree import ElementTree as ET
-                            ns = {"d": "DAV:", "c": "urn:ietf:params:xml:ns:caldav"}
                             try:
-                                root2 = ET.fromstring(text2)
-                                for response in root2.findall("d:response", ns):
-                                    href_el = response.find("d:href", ns)
-                                    propstat = response.find("d:propstat", ns)
-                                    if href_el is None or propstat is None:
-                                        continue
-                                    prop = propstat.find("d:prop", ns)
-                                    if prop is None:
-                                        continue
-                                    rtype = prop.find("d:resourcetype", ns)
-                                    displayname_el = prop.find("d:displayname", ns)
-                                    displayname = displayname_el.text.strip() if displayname_el is not None and displayname_el.text else ""
-                                    href_child = href_el.text.strip() if href_el.text else ""
-                                    is_calendar = rtype is not None and rtype.find("c:calendar", ns) is not None
+                                for href_child, displayname, is_calendar in _propfind_entries(_xml_root(text2)):
                                     if is_calendar and href_child != calendars_root_href:
                                         full_child_href = href_child if href_child.endswith('/') else href_child + '/'
-                                        if full_child_href.startswith('/'):
-                                            full_child_href = self.base_url.rstrip('/') + full_child_href
-                                        calendars.append({"href": full_child_href, "name": displayname or "Calendar"})
+                                        calendars.append({"href": self._abs_url(full_child_href), "name": displayname or "Calendar"})
                             except Exception as e:
                                 logger.info(f"Failed to parse calendars collection XML: {e}")
                 except Exception as e:
                     logger.info(f"Error during calendars root enumeration: {e}")
 
-            preferred = [c for c in calendars if c["name"].lower() in ("main", "основной")]
-            selected = preferred or calendars
+            preferred = next((c for c in calendars if c["name"].lower() in self._PREFERRED_NAMES), None)
+            selected = [preferred] if preferred else calendars
             if selected:
                 for c in selected:
                     logger.info(f"CalDAV calendar selected: {c['href']} name={c['name']}")
@@ -152,22 +587,32 @@ class CalDAVManager:
             # Fallback candidates
             candidates = [
                 f"{self.principal_url}calendar/",
-                f"{self.base_url}/dav/{self.email}/calendar/",
-                f"{self.base_url}/dav/{self.email}/",
-                f"{self.base_url}/calendars/{self.email}/",
+                f"{self._base}/dav/{self.email}/calendar/",
+                f"{self._base}/dav/{self.email}/",
+                f"{self._base}/calendars/{self.email}/",
             ]
-            # Сокращённый fallback перебор
-            for href in candidates:
+            async def _probe(href: str) -> bool:
                 try:
                     async with session.request("PROPFIND", href, headers={"Depth": "0"}) as resp:
-                        body = await resp.text()
+                        await resp.read()
                         if resp.status in (200, 207):
-                            logger.info(f"CalDAV fallback calendar path detected: {href}")
-                            return [{"href": href, "name": "Calendar"}]
-                        else:
-                            logger.debug(f"Fallback probe failed: {href} status={resp.status}")
+                            return True
+                        logger.debug(f"Fallback probe failed: {href} status={resp.status}")
                 except Exception as e:
                     logger.debug(f"Fallback probe error {href}: {e}")
+                return False
+
+            # Все пробы стартуют сразу; результат берётся по порядку приоритета,
+            # оставшиеся отменяются после первого успеха
+            probes = [asyncio.create_task(_probe(href)) for href in candidates]
+            try:
+                for href, probe in zip(candidates, probes):
+                    if await probe:
+                        logger.info(f"CalDAV fallback calendar path detected: {href}")
+                        return [{"href": href, "name": "Calendar"}]
+            finally:
+                for probe in probes:
+                    probe.cancel()
 
             logger.error("No CalDAV calendar path found after enumeration and fallback probes")
             return []
@@ -175,11 +620,16 @@ class CalDAVManager:
             logger.error(f"Error getting calendars: {e}")
             return []
     
-    async def get_events(self, start_date: datetime = None, end_date: datetime = None) -> List[Dict]:
-        """Получить события за период"""
+    async def get_events(self, start_date: datetime = None,
+                         end_date: datetime = None) -> Tuple[List[Dict], bool]:
+        """Получить события за период -> (события, ответил ли сервер успешно).
+
+        Состояние запроса держится в локальных переменных: менеджер из пула
+        может обслуживать несколько вызовов одновременно.
+        """
         all_events: List[Dict] = []
-        self.last_events_statuses = []
-        self.last_events_ok = False
+        statuses: List[int] = []
+        ok = False
         try:
             if not start_date:
                 start_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
@@ -188,15 +638,14 @@ class CalDAVManager:
 
             # Локализуем диапазон к таймзоне конфигурации, чтобы корректно сформировать UTC диапазон.
             try:
-                tz_localize = pytz.timezone(Config.TZ)
                 if start_date.tzinfo is None:
-                    start_date = tz_localize.localize(start_date)
+                    start_date = start_date.replace(tzinfo=_TZ)
                 else:
-                    start_date = start_date.astimezone(tz_localize)
+                    start_date = start_date.astimezone(_TZ)
                 if end_date.tzinfo is None:
-                    end_date = tz_localize.localize(end_date)
+                    end_date = end_date.replace(tzinfo=_TZ)
                 else:
-                    end_date = end_date.astimezone(tz_localize)
+                    end_date = end_date.astimezone(_TZ)
             except Exception:
                 pass
 
@@ -204,7 +653,7 @@ class CalDAVManager:
             calendars = await self.get_calendars()
             if not calendars:
                 logger.info("No calendars discovered to fetch events")
-                return []
+                return [], False
 
             body = self._build_calendar_query(start_date, end_date)
             headers = {
@@ -212,58 +661,60 @@ class CalDAVManager:
                 "Content-Type": "application/xml; charset=utf-8",
             }
 
+            # href календарей уже абсолютные (нормализуются при обнаружении)
+            cal_urls = [cal["href"] for cal in calendars if cal.get("href")]
+
+            async def _report(cal_href_full: str, query: str, label: str) -> List[Dict]:
+                nonlocal ok
+                async with session.request("REPORT", cal_href_full, data=query, headers=headers) as resp:
+                    statuses.append(resp.status)
+                    if resp.status not in (200, 207):
+                        logger.debug(f"CalDAV REPORT {label} failed: {resp.status} for {cal_href_full}")
+                        return []
+                    ok = True
+                    # XML разбирается по мере прихода порций — тело ответа целиком не буферизуется,
+                    # наружу выходят только тексты calendar-data
+                    items: List[Tuple[str, str, str]] = []
+                    received = 0
+                    puller = _CalendarDataPuller()
+                    try:
+                        async for chunk in resp.content.iter_chunked(_REPORT_CHUNK):
+                            received += len(chunk)
+                            items.extend(puller.feed(chunk))
+                        items.extend(puller.close())
+                    except ET.ParseError as xml_err:
+                        logger.error(f"Error parsing CalDAV events XML: {xml_err}")
+                    # Сокращенный лог только статуса запроса
+                    logger.info(f"CalDAV REPORT {label} status={resp.status} href={cal_href_full} len={received}")
+                if not items:
+                    # Пустой multistatus (нет событий в диапазоне)
+                    return []
+                evs = await self._parse_events_async(items)
+                logger.debug(f"Fetched {len(evs)} events ({label}) from {cal_href_full}")
+                return evs
+
+            async def _fetch_all(query: str, label: str):
+                # Календари запрашиваются параллельно; ошибка одного не обнуляет остальные
+                results = await asyncio.gather(*(_report(url, query, label) for url in cal_urls),
+                                               return_exceptions=True)
+                for url, res in zip(cal_urls, results):
+                    if isinstance(res, Exception):
+                        logger.debug(f"Error fetching events from {url}: {res}")
+                        continue
+                    all_events.extend(res)
+
             # Основной запрос (точный диапазон)
-            for cal in calendars:
-                cal_href = cal.get("href")
-                if not cal_href:
-                    continue
-                # Нормализуем относительные пути в абсолютный URL
-                if cal_href.startswith('/'):
-                    cal_href_full = self.base_url.rstrip('/') + cal_href
-                else:
-                    cal_href_full = cal_href
-                try:
-                    async with session.request("REPORT", cal_href_full, data=body, headers=headers) as resp:
-                        self.last_events_statuses.append(resp.status)
-                        if resp.status not in (200, 207):
-                            logger.debug(f"CalDAV REPORT failed: {resp.status} for {cal_href_full}")
-                            continue
-                        self.last_events_ok = True
-                        text = await resp.text()
-                        # Сокращенный лог только статуса запроса
-                        logger.info(f"CalDAV REPORT primary status={resp.status} href={cal_href_full} len={len(text)}")
-                    evs = self._parse_events(text)
-                    logger.debug(f"Fetched {len(evs)} events from {cal_href_full}")
-                    all_events.extend(evs)
-                except Exception as ce:
-                    logger.debug(f"Error fetching events from {cal_href_full}: {ce}")
-
-            # Fallback расширенный диапазон REPORT если ничего не нашли
-            if not all_events:
+            await _fetch_all(body, "primary")
+            if not ok:
+                # Ни один календарь не ответил — возможно, кэшированные href устарели
+                self.invalidate_calendars()
+
+            # Fallback расширенный диапазон REPORT — только если сервер не ответил успешно;
+            # пустой 207 на time-range означает, что встреч в диапазоне нет
+            if not all_events and not ok:
                 ext_start = start_date
                 ext_end = start_date + timedelta(days=7)
-                body_ext = self._build_calendar_query(ext_start, ext_end)
-                for cal in calendars:
-                    cal_href = cal.get("href")
-                    if not cal_href:
-                        continue
-                    if cal_href.startswith('/'):
-                        cal_href_full = self.base_url.rstrip('/') + cal_href
-                    else:
-                        cal_href_full = cal_href
-                    try:
-                        async with session.request("REPORT", cal_href_full, data=body_ext, headers=headers) as resp:
-                            self.last_events_statuses.append(resp.status)
-                            if resp.status not in (200, 207):
-                                continue
-                            self.last_events_ok = True
-                            text = await resp.text()
-                            logger.info(f"CalDAV REPORT fallback status={resp.status} href={cal_href_full} len={len(text)}")
-                        evs = self._parse_events(text)
-                        logger.debug(f"Fallback range fetched {len(evs)} events from {cal_href_full}")
-                        all_events.extend(evs)
-                    except Exception:
-                        continue
+                await _fetch_all(self._build_calendar_query(ext_start, ext_end), "fallback")
         except Exception as e:
             logger.error(f"Error getting events: {e}")
         finally:
@@ -272,40 +723,44 @@ class CalDAVManager:
                 if all_events:
                     for i, ev in enumerate(all_events[:10]):
                         logger.info(f"ALL_EVENTS[{i}] uid={ev.get('uid')} title={ev.get('title')} start={ev.get('start_time')} end={ev.get('end_time')}")
+                elif ok:
+                    logger.info("ALL_EVENTS empty: no events in requested time-range")
                 else:
-                    logger.info("ALL_EVENTS empty after REPORT aggregation (will try python-caldav fallback)")
+                    logger.info(f"ALL_EVENTS empty after REPORT aggregation, statuses={statuses} "
+                                f"(will try python-caldav fallback)")
             except Exception:
                 pass
 
-        # Python-caldav fallback (date_search) теперь достижим
-        if not all_events:
+        # Python-caldav fallback (date_search) — если REPORT не сработал
+        if not all_events and not ok:
             try:
                 import caldav
                 logger.info("Fallback: using python-caldav date_search")
-                base_url = self.base_url.rstrip('/')
-                principal = caldav.Principal(
-                    client=caldav.DAVClient(url=base_url, username=self.email, password=self.password),
-                    url=self.principal_url,
-                )
-                calendars2 = principal.calendars()
-                if not calendars2:
-                    logger.info("Fallback caldav: no calendars returned by principal")
-                    return []
-                preferred_names = {"main", "основной"}
-                selected = None
-                for c in calendars2:
-                    name = getattr(c, 'name', '') or ''
-                    if name.lower() in preferred_names:
-                        selected = c
-                        break
-                if selected is None:
-                    selected = calendars2[0]
-                tz_local = pytz.timezone(Config.TZ)
-                s_local = (start_date or datetime.now()).astimezone(tz_local) if (start_date and start_date.tzinfo) else (start_date or datetime.now()).replace(tzinfo=tz_local)
+                base_url = self._base
+                s_local = (start_date or datetime.now()).astimezone(_TZ) if (start_date and start_date.tzinfo) else (start_date or datetime.now()).replace(tzinfo=_TZ)
                 e_local = (end_date or (start_date or datetime.now()) + timedelta(days=1))
-                e_local = e_local.astimezone(tz_local) if (e_local and e_local.tzinfo) else e_local.replace(tzinfo=tz_local)
-                raw_events = selected.date_search(s_local, e_local)
-                self.last_events_ok = True
+                e_local = e_local.astimezone(_TZ) if (e_local and e_local.tzinfo) else e_local.replace(tzinfo=_TZ)
+
+                def _date_search():
+                    # python-caldav синхронный: PROPFIND + REPORT выполняются в потоке, а не в event loop
+                    principal = caldav.Principal(
+                        client=caldav.DAVClient(url=base_url, username=self.email, password=self.password),
+                        url=self.principal_url,
+                    )
+                    calendars2 = principal.calendars()
+                    if not calendars2:
+                        return None
+                    selected = next(
+                        (c for c in calendars2 if (getattr(c, 'name', '') or '').lower() in self._PREFERRED_NAMES),
+                        calendars2[0],
+                    )
+                    return selected.date_search(s_local, e_local)
+
+                raw_events = await asyncio.to_thread(_date_search)
+                if raw_events is None:
+                    logger.info("Fallback caldav: no calendars returned by principal")
+                    return [], False
+                ok = True
                 logger.info(f"Fallback caldav: date_search returned {len(raw_events)} items")
                 for ev_obj in raw_events:
                     try:
@@ -319,47 +774,9 @@ class CalDAVManager:
                         except Exception as pe:
                             logger.debug(f"Fallback caldav: ical parse failed {pe}")
                             continue
-                        for comp in cal.walk():
-                            if comp.name != 'VEVENT':
-                                continue
+                        for comp in cal.walk('VEVENT'):
                             try:
-                                uid = str(comp.get('uid', ''))
-                                title = str(comp.get('summary', 'Без названия'))
-                                dtstart = comp.get('dtstart').dt
-                                dtend = comp.get('dtend').dt if comp.get('dtend') else None
-                                tz_cfg = pytz.timezone(Config.TZ)
-                                if isinstance(dtstart, datetime):
-                                    dtstart = dtstart.astimezone(tz_cfg) if dtstart.tzinfo else tz_cfg.localize(dtstart)
-                                if isinstance(dtend, datetime):
-                                    dtend = dtend.astimezone(tz_cfg) if dtend.tzinfo else tz_cfg.localize(dtend)
-                                attendees: List[str] = []
-                                for att in comp.get_all('attendee', []):
-                                    a = str(att)
-                                    # Remove mailto: prefix
-                                    if a.lower().startswith('mailto:'):
-                                        a = a[7:]
-                                    # Clean up whitespace, newlines, and take first word
-                                    a = a.strip().replace('\n', '').replace('\r', '').split()[0] if a.strip() else ''
-                                    if a:
-                                        attendees.append(a)
-                                organizer = comp.get('organizer')
-                                organizer_email = ''
-                                if organizer:
-                                    organizer_email = str(organizer)
-                                    if organizer_email.lower().startswith('mailto:'):
-                                        organizer_email = organizer_email[7:]
-                                events_dict = {
-                                    'uid': uid,
-                                    'title': title,
-                                    'start_time': dtstart.isoformat() if isinstance(dtstart, datetime) else '',
-                                    'end_time': dtend.isoformat() if isinstance(dtend, datetime) else '',
-                                    'attendees': attendees,
-                                    'description': str(comp.get('description', '')),
-                                    'location': str(comp.get('location', '')),
-                                    'organizer': organizer_email,
-                                    'status': str(comp.get('status', 'CONFIRMED')),
-                                }
-                                all_events.append(events_dict)
+                                all_events.append(_vevent_to_dict(comp))
                             except Exception as ce_inner:
                                 logger.debug(f"Fallback caldav: error building event dict {ce_inner}")
                     except Exception as ce_ev:
@@ -368,117 +785,83 @@ class CalDAVManager:
                     logger.info(f"Fallback caldav: aggregated {len(all_events)} events")
             except Exception as e_fb:
                 logger.info(f"Fallback caldav failed: {e_fb}")
-        return all_events
+        return all_events, ok
     
     async def create_event(self, title: str, start: datetime, end: datetime, 
                           attendees: List[str] = None, description: str = "", 
                           location: str = "") -> bool:
         """Создать событие в CalDAV"""
         try:
-            import vobject
-            import uuid
-            
             if attendees is None:
                 attendees = []
-            
+
             # Убедимся что start и end - timezone-aware datetime
-            tz = pytz.timezone(Config.TZ)
             if isinstance(start, str):
                 start = datetime.fromisoformat(start)
             if isinstance(end, str):
                 end = datetime.fromisoformat(end)
-            
-            # Нормализуем timezone - используем localize для правильного TZID
+
+            # Наивное время считается временем Config.TZ; в iCalendar пишем UTC (без TZID/VTIMEZONE)
             if start.tzinfo is None:
-                start = tz.localize(start)
-            else:
-                start = start.astimezone(tz)
-            
+                start = start.replace(tzinfo=_TZ)
             if end.tzinfo is None:
-                end = tz.localize(end)
-            else:
-                end = end.astimezone(tz)
-            
-            # Get calendar using python-caldav
+                end = end.replace(tzinfo=_TZ)
+
             calendars = await self.get_calendars()
             if not calendars:
                 logger.error("No calendars found")
                 return False
-            
+
             # Use first calendar (Main/Основной preferred by get_calendars)
             calendar_url = calendars[0]['href']
-            
-            # Create vobject iCalendar
-            vcal = vobject.iCalendar()
-            vevent = vcal.add('vevent')
-            
+
+            # iCalendar собирается напрямую: форма события фиксирована
             uid = str(uuid.uuid4())
-            vevent.add('uid').value = uid
-            vevent.add('summary').value = title
-            
-            # Add dtstart with TZID parameter
-            dtstart_prop = vevent.add('dtstart')
-            dtstart_prop.value = start
-            
-            # Add dtend with TZID parameter
-            dtend_prop = vevent.add('dtend')
-            dtend_prop.value = end
-            
-            vevent.add('dtstamp').value = datetime.utcnow().replace(tzinfo=pytz.UTC)
-            vevent.add('created').value = datetime.utcnow().replace(tzinfo=pytz.UTC)
-            vevent.add('last-modified').value = datetime.utcnow().replace(tzinfo=pytz.UTC)
-            vevent.add('status').value = 'CONFIRMED'
-            vevent.add('sequence').value = "0"
-            vevent.add('transp').value = 'OPAQUE'
-            
+            # Одно чтение часов на DTSTAMP/CREATED/LAST-MODIFIED, без промежуточного datetime
+            stamp = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+            lines = [
+                "BEGIN:VCALENDAR",
+                "VERSION:2.0",
+                "PRODID:-//loop_calendar_bot//EN",
+                "BEGIN:VEVENT",
+                f"UID:{uid}",
+                f"SUMMARY:{_ics_escape(title)}",
+                f"DTSTART:{start.astimezone(_UTC).strftime('%Y%m%dT%H%M%SZ')}",
+                f"DTEND:{end.astimezone(_UTC).strftime('%Y%m%dT%H%M%SZ')}",
+                f"DTSTAMP:{stamp}",
+                f"CREATED:{stamp}",
+                f"LAST-MODIFIED:{stamp}",
+                "STATUS:CONFIRMED",
+                "SEQUENCE:0",
+                "TRANSP:OPAQUE",
+            ]
             if description:
-                vevent.add('description').value = description
+                lines.append(f"DESCRIPTION:{_ics_escape(description)}")
             if location:
-                vevent.add('location').value = location
-            
-            # Add organizer
-            organizer = vevent.add('organizer')
-            organizer.value = f'mailto:{self.email}'
-            organizer.params['CN'] = [self.email]
-            
-            # Add attendees
+                lines.append(f"LOCATION:{_ics_escape(location)}")
+            lines.append(f'ORGANIZER;CN="{self.email}":mailto:{self.email}')
             for addr in attendees:
                 if addr and addr != self.email:
-                    att = vevent.add('attendee')
-                    att.value = f'mailto:{addr}'
-                    att.params['CN'] = [addr]
-                    att.params['ROLE'] = ['REQ-PARTICIPANT']
-            
-            # Serialize to iCalendar format
-            ical_str = vcal.serialize()
-            
+                    lines.append(f'ATTENDEE;CN="{addr}";ROLE=REQ-PARTICIPANT:mailto:{addr}')
+            lines.append("END:VEVENT")
+            lines.append("END:VCALENDAR")
+            ical_str = "".join(_ics_fold(line) for line in lines)
+
             # PUT event to calendar
             event_url = f"{calendar_url.rstrip('/')}/{uid}.ics"
             headers = {
                 'Content-Type': 'text/calendar; charset=utf-8',
             }
-            
-            # Initialize session if needed
-            if not self.session:
-                await self.init_session()
-            
-            from aiohttp import BasicAuth
-            auth = BasicAuth(self.email, self.password)
-            
-            response = await self.session.put(
-                event_url,
-                data=ical_str.encode('utf-8'),
-                headers=headers,
-                auth=auth
-            )
-            
-            if response.status in (200, 201, 204):
-                logger.info(f"Event '{title}' created successfully: {uid}")
-                return True
-            else:
-                response_text = await response.text()
-                logger.error(f"Failed to create event: {response.status} {response_text}")
-                return False
+
+            session = await self._get_session()
+            async with session.put(event_url, data=ical_str.encode('utf-8'), headers=headers) as response:
+                if response.status in (200, 201, 204):
+                    logger.info(f"Event '{title}' created successfully: {uid}")
+                    return True
+                else:
+                    response_text = await response.text()
+                    logger.error(f"Failed to create event: {response.status} {response_text}")
+                    return False
                 
         except Exception as e:
             logger.error(f"Error creating event: {e}")
@@ -487,9 +870,8 @@ class CalDAVManager:
     def _build_calendar_query(self, start: datetime, end: datetime) -> str:
         """Построить CalDAV REPORT запрос"""
         # Преобразуем в UTC перед добавлением 'Z'
-        import pytz
-        start_utc = start.astimezone(pytz.UTC) if start.tzinfo else start
-        end_utc = end.astimezone(pytz.UTC) if end.tzinfo else end
+        start_utc = start.astimezone(_UTC) if start.tzinfo else start
+        end_utc = end.astimezone(_UTC) if end.tzinfo else end
         start_str = start_utc.strftime("%Y%m%dT%H%M%SZ")
         end_str = end_utc.strftime("%Y%m%dT%H%M%SZ")
         
@@ -514,335 +896,95 @@ class CalDAVManager:
     </C:filter>
 </C:calendar-query>"""
     
-    def _parse_events(self, xml_text: str) -> List[Dict]:
-        """Парсить REPORT XML -> события (устойчивый парсер)."""
+    async def _parse_events_async(self, items: List[Tuple[str, str, str]]) -> List[Dict]:
+        """Разобрать calendar-data из REPORT; средние объёмы — в потоке, большие — в пуле процессов"""
+        size = sum(len(item[2]) for item in items)
+        if size < _PARSE_THREAD_MIN:
+            return self._parse_calendar_data(items)
+        if size < _PARSE_OFFLOAD_MIN:
+            # Накладные расходы процесса не окупаются; поток хотя бы отпускает loop между переключениями GIL
+            return await asyncio.to_thread(CalDAVManager._parse_calendar_data, items)
+        async with _parse_sem:
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(_get_parse_pool(), CalDAVManager._parse_calendar_data, items)
+            except Exception as e:
+                logger.warning(f"Parse pool failed, parsing inline: {e}")
+                return self._parse_calendar_data(items)
+
+    @staticmethod
+    def _parse_calendar_data(items: List[Tuple[str, str, str]]) -> List[Dict]:
+        """(href, etag, calendar-data) -> события (устойчивый парсер)."""
         events: List[Dict] = []
         if not Calendar:
             return events
         try:
-            from xml.etree import ElementTree as ET
-            root = ET.fromstring(xml_text)
-            ns = {"d": "DAV:", "c": "urn:ietf:params:xml:ns:caldav", "C": "urn:ietf:params:xml:ns:caldav"}
             block_index = 0
             ical_blocks: List[str] = []
-            for resp in root.findall("d:response", ns):
-                for propstat in resp.findall("d:propstat", ns):
-                    prop = propstat.find("d:prop", ns)
-                    if prop is None:
-                        continue
-                    caldata_el = None
-                    for child in list(prop):
-                        if child.tag.endswith("calendar-data") and child.text:
-                            caldata_el = child
-                            break
-                    if caldata_el is None:
+            for href, etag, raw_ical in items:
+                cache_key = (href, etag) if etag else None
+                if cache_key is not None:
+                    with _parsed_cache_lock:
+                        cached = _parsed_cache.get(cache_key)
+                        if cached is not None:
+                            _parsed_cache.move_to_end(cache_key)
+                    if cached is not None and cached[0] == raw_ical:
+                        # Копии: вызывающий код дополняет словари событий своими полями
+                        events.extend(dict(ev) for ev in cached[1])
+                        block_index += 1
                         continue
-                    # Извлекаем полный текст calendar-data, включая возможные дополнительные text nodes
-                    try:
-                        raw_ical = ''.join(caldata_el.itertext())
-                    except Exception:
-                        raw_ical = caldata_el.text or ''
-                    raw_ical = raw_ical.strip()
-                    # RFC 5545 line unfolding: объединить строки, начинающиеся с пробела
-                    lines = raw_ical.split('\n')
-                    unfolded_lines = []
-                    for line in lines:
-                        if line.startswith(' ') or line.startswith('\t'):
-                            # Продолжение предыдущей строки
-                            if unfolded_lines:
-                                unfolded_lines[-1] += line[1:]  # Убираем первый пробел
-                        else:
-                            unfolded_lines.append(line)
-                    raw_ical = '\n'.join(unfolded_lines)
-                    # Убрали подробное превью для снижения шума
-                    cleaned = ''.join(ch for ch in raw_ical if ch in ('\n','\r') or ord(ch) >= 32)
-                    ical_blocks.append(cleaned)
-                    parse_source = cleaned
-                    parsed = False
+                source_ical = raw_ical
+                raw_ical = raw_ical.strip()
+                # RFC 5545 line unfolding: перевод строки + пробел/таб — продолжение
+                raw_ical = _UNFOLD_RE.sub('', raw_ical)
+                # Убрали подробное превью для снижения шума
+                cleaned = raw_ical.translate(_CTRL_TABLE)
+                ical_blocks.append(cleaned)
+                parse_source = cleaned
+                parsed = False
+                try:
+                    cal = Calendar.from_ical(parse_source)
+                    parsed = True
+                    logger.debug(f"Calendar-data block {block_index} parsed len={len(parse_source)}")
+                except Exception as e_first:
+                    logger.debug(f"Calendar-data block {block_index} initial parse failed: {e_first}")
                     try:
-                        cal = Calendar.from_ical(parse_source)
+                        cal = Calendar.from_ical(parse_source.encode('utf-8','ignore'))
                         parsed = True
-                        logger.debug(f"Calendar-data block {block_index} parsed len={len(parse_source)}")
-                    except Exception as e_first:
-                        logger.debug(f"Calendar-data block {block_index} initial parse failed: {e_first}")
-                        try:
-                            cal = Calendar.from_ical(parse_source.encode('utf-8','ignore'))
-                            parsed = True
-                            logger.debug(f"Calendar-data block {block_index} parsed second attempt bytes len={len(parse_source)}")
-                        except Exception as e_second:
-                            logger.debug(f"Calendar-data block {block_index} parse failed bytes: {e_second}")
-                            block_index += 1
-                            continue
-                    if not parsed:
+                        logger.debug(f"Calendar-data block {block_index} parsed second attempt bytes len={len(parse_source)}")
+                    except Exception as e_second:
+                        logger.debug(f"Calendar-data block {block_index} parse failed bytes: {e_second}")
                         block_index += 1
                         continue
-                    for component in cal.walk():
-                        if component.name != "VEVENT":
-                            continue
-                        try:
-                            uid = str(component.get("uid", ""))
-                            title = str(component.get("summary", "Без названия"))
-                            raw_dtstart = component.get("dtstart")
-                            raw_dtend = component.get("dtend")
-                            dtstart = raw_dtstart.dt if raw_dtstart else None
-                            dtend = raw_dtend.dt if raw_dtend else None
-                            # Debug raw values + tzinfo
-                            # Минимальный лог на случай разбора — отключен для снижения шума
-                            tz = pytz.timezone(Config.TZ)
-                            if not isinstance(dtstart, datetime):
-                                dtstart = datetime.combine(dtstart, datetime.min.time())
-                            if not isinstance(dtend, datetime):
-                                dtend = datetime.combine(dtend, datetime.min.time())
-                            if dtstart.tzinfo is None:
-                                dtstart = tz.localize(dtstart)
-                            else:
-                                dtstart = dtstart.astimezone(tz)
-                            if dtend.tzinfo is None:
-                                dtend = tz.localize(dtend)
-                            else:
-                                dtend = dtend.astimezone(tz)
-                            attendees: List[str] = []
-                            for att in component.get_all("attendee", []):
-                                # att is vCalAddress object with params and value
-                                addr = str(att)
-                                # Remove mailto: prefix if present
-                                if addr.lower().startswith("mailto:"):
-                                    addr = addr[7:]
-                                # Clean up any trailing/leading whitespace, newlines, and split on whitespace
-                                addr = addr.strip().replace('\n', '').replace('\r', '').split()[0] if addr.strip() else ''
-                                if addr:
-                                    attendees.append(addr)
-                            organizer = component.get("organizer")
-                            organizer_email = ""
-                            if organizer:
-                                organizer_email = str(organizer)
-                                if organizer_email.lower().startswith("mailto:"):
-                                    organizer_email = organizer_email[7:]
-                            description = str(component.get("description", ""))
-                            location = str(component.get("location", ""))
-                            status = str(component.get("status", "CONFIRMED"))
-                            rrule_text = ""
-                            rrule_raw = component.get("rrule")
-                            if rrule_raw:
-                                try:
-                                    rrule_text = rrule_raw.to_ical().decode()
-                                except Exception:
-                                    rrule_text = str(rrule_raw)
-                            exdates: List[str] = []
-                            exdate_props = component.get('exdate') or []
-                            if not isinstance(exdate_props, list):
-                                exdate_props = [exdate_props]
-                            for ex_prop in exdate_props:
-                                try:
-                                    dts = getattr(ex_prop, 'dts', None)
-                                    if dts:
-                                        for dt_entry in dts:
-                                            dt_val = getattr(dt_entry, 'dt', dt_entry)
-                                            if not isinstance(dt_val, datetime):
-                                                dt_val = datetime.combine(dt_val, datetime.min.time())
-                                            if dt_val.tzinfo is None:
-                                                dt_val = tz.localize(dt_val)
-                                            else:
-                                                dt_val = dt_val.astimezone(tz)
-                                            exdates.append(dt_val.isoformat())
-                                except Exception:
-                                    continue
-                            
-                            # Extract VALARM components
-                            alarms = []
-                            for subcomp in component.walk():
-                                if subcomp.name == "VALARM":
-                                    trigger = subcomp.get("trigger")
-                                    if trigger:
-                                        try:
-                                            # TRIGGER can be absolute datetime or relative duration
-                                            if hasattr(trigger, 'dt'):
-                                                # Absolute datetime
-                                                alarm_dt = trigger.dt
-                                                if isinstance(alarm_dt, datetime):
-                                                    if alarm_dt.tzinfo is None:
-                                                        alarm_dt = tz.localize(alarm_dt)
-                                                    else:
-                                                        alarm_dt = alarm_dt.astimezone(tz)
-                                                    alarms.append(alarm_dt.isoformat())
-                                            elif hasattr(trigger, 'td'):
-                                                # Relative timedelta (e.g., -PT15M)
-                                                alarm_dt = dtstart + trigger.td
-                                                alarms.append(alarm_dt.isoformat())
-                                        except Exception as alarm_err:
-                                            logger.debug(f"Failed to parse VALARM trigger: {alarm_err}")
-                            
-                            events.append({
-                                "uid": uid,
-                                "title": title,
-                                "start_time": dtstart.isoformat(),
-                                "end_time": dtend.isoformat(),
-                                "attendees": attendees,
-                                "description": description,
-                                "location": location,
-                                "organizer": organizer_email,
-                                "status": status,
-                                "alarms": alarms,
-                                "rrule": rrule_text,
-                                "exdate": exdates,
-                            })
-                            # Без подробного лога добавления события
-                        except Exception as ve_inner:
-                            if Config.CALDAV_LOG_PARSE_ERRORS:
-                                logger.debug(f"Failed VEVENT parse uid={component.get('uid')} err={ve_inner}")
-                            continue
+                if not parsed:
                     block_index += 1
+                    continue
+                block_events: List[Dict] = []
+                for component in cal.walk("VEVENT"):
+                    try:
+                        block_events.append(_vevent_to_dict(component))
+                        # Без подробного лога добавления события
+                    except Exception as ve_inner:
+                        if Config.CALDAV_LOG_PARSE_ERRORS:
+                            logger.debug(f"Failed VEVENT parse uid={component.get('uid')} err={ve_inner}")
+                        continue
+                if cache_key is not None and block_events:
+                    with _parsed_cache_lock:
+                        _parsed_cache[cache_key] = (source_ical, block_events)
+                        _parsed_cache.move_to_end(cache_key)
+                        while len(_parsed_cache) > _PARSED_CACHE_MAX:
+                            _parsed_cache.popitem(last=False)
+                    events.extend(dict(ev) for ev in block_events)
+                else:
+                    events.extend(block_events)
+                block_index += 1
             if events:
                 logger.info(f"Parsed {len(events)} CalDAV events from REPORT response")
             else:
                 logger.info("Parsed 0 CalDAV events from REPORT response")
-                # Regex fallback: если стандартный парсер ничего не дал, пытаемся извлечь VEVENT вручную
+                # Запасной разбор: если стандартный парсер ничего не дал, извлекаем VEVENT построчно
                 try:
-                    import re
-                    tz_local = pytz.timezone(Config.TZ)
-                    fallback_events = []
-                    for ib_idx, block in enumerate(ical_blocks):
-                        for match in re.finditer(r"BEGIN:VEVENT(.*?)END:VEVENT", block, re.DOTALL):
-                            vevent_raw = match.group(1)
-                            # Извлекаем ключевые поля простыми regex
-                            def rex(field):
-                                m = re.search(rf"^{field}:(.+)$", vevent_raw, re.MULTILINE)
-                                return m.group(1).strip() if m else ""
-                            def rex_tz(field):
-                                # DTSTART;TZID=Europe/Moscow:20251122T011500
-                                m = re.search(rf"^{field}(?:;TZID=([^:]+))?:(.+)$", vevent_raw, re.MULTILINE)
-                                if m:
-                                    return m.group(1) or "", m.group(2).strip()
-                                return "", ""
-                            uid = rex("UID") or f"fallback-{ib_idx}-{len(fallback_events)}"
-                            summary = rex("SUMMARY") or "Без названия"
-                            status = rex("STATUS") or "CONFIRMED"
-                            rrule_text = rex("RRULE")
-                            tzid_start, dtstart_raw = rex_tz("DTSTART")
-                            tzid_end, dtend_raw = rex_tz("DTEND")
-                            dtstart = None
-                            dtend = None
-                            dt_fmt_candidates = ["%Y%m%dT%H%M%S", "%Y%m%dT%H%M"]
-                            for fmt in dt_fmt_candidates:
-                                if dtstart is None and dtstart_raw:
-                                    try:
-                                        dtstart = datetime.strptime(dtstart_raw, fmt)
-                                    except Exception:
-                                        pass
-                                if dtend is None and dtend_raw:
-                                    try:
-                                        dtend = datetime.strptime(dtend_raw, fmt)
-                                    except Exception:
-                                        pass
-                            if dtstart is not None:
-                                if tzid_start:
-                                    try:
-                                        tz_parsed = pytz.timezone(tzid_start)
-                                    except Exception:
-                                        tz_parsed = tz_local
-                                else:
-                                    tz_parsed = tz_local
-                                dtstart = tz_parsed.localize(dtstart)
-                            if dtend is not None:
-                                if tzid_end:
-                                    try:
-                                        tz_parsed_e = pytz.timezone(tzid_end)
-                                    except Exception:
-                                        tz_parsed_e = tz_local
-                                else:
-                                    tz_parsed_e = tz_local
-                                dtend = tz_parsed_e.localize(dtend)
-                            if dtstart and dtend:
-                                # Extract ATTENDEE emails from regex
-                                attendees = []
-                                for att_match in re.finditer(r"^ATTENDEE[^:]*:mailto:(.+)$", vevent_raw, re.MULTILINE):
-                                    email = att_match.group(1).strip()
-                                    # Remove any trailing/leading whitespace, newlines, and take first word
-                                    email = email.replace('\n', '').replace('\r', '').split()[0] if email else ""
-                                    if email:
-                                        attendees.append(email)
-                                
-                                # Extract ORGANIZER email
-                                organizer = ""
-                                org_match = re.search(r"^ORGANIZER[^:]*:mailto:(.+)$", vevent_raw, re.MULTILINE)
-                                if org_match:
-                                    organizer = org_match.group(1).strip().replace('\n', '').replace('\r', '').split()[0]
-                                
-                                # Extract description and location
-                                description = rex("DESCRIPTION")
-                                location = rex("LOCATION")
-
-                                # Extract EXDATE entries
-                                exdates: List[str] = []
-                                for ex_match in re.finditer(r"^EXDATE(?:;TZID=([^:]+))?:(.+)$", vevent_raw, re.MULTILINE):
-                                    ex_tzid = ex_match.group(1)
-                                    ex_values = ex_match.group(2).split(',')
-                                    for ex_val in ex_values:
-                                        ex_val = ex_val.strip()
-                                        if not ex_val:
-                                            continue
-                                        ex_dt = None
-                                        for fmt in ["%Y%m%dT%H%M%SZ", "%Y%m%dT%H%M%S", "%Y%m%dT%H%M"]:
-                                            try:
-                                                ex_dt = datetime.strptime(ex_val, fmt)
-                                                break
-                                            except Exception:
-                                                continue
-                                        if ex_dt is None:
-                                            continue
-                                        if ex_val.endswith('Z'):
-                                            ex_dt = pytz.UTC.localize(ex_dt.replace(tzinfo=None))
-                                        elif ex_tzid:
-                                            try:
-                                                tz_ex = pytz.timezone(ex_tzid)
-                                            except Exception:
-                                                tz_ex = tz_local
-                                            ex_dt = tz_ex.localize(ex_dt)
-                                        else:
-                                            ex_dt = tz_local.localize(ex_dt)
-                                        exdates.append(ex_dt.isoformat())
-                                
-                                # Extract VALARM triggers from regex
-                                alarms = []
-                                for valarm_match in re.finditer(r"BEGIN:VALARM(.*?)END:VALARM", vevent_raw, re.DOTALL):
-                                    valarm_content = valarm_match.group(1)
-                                    trigger_m = re.search(r"^TRIGGER[^:]*:(.+)$", valarm_content, re.MULTILINE)
-                                    if trigger_m:
-                                        trigger_val = trigger_m.group(1).strip()
-                                        # Parse relative duration (e.g., -PT15M)
-                                        if trigger_val.startswith("-PT") or trigger_val.startswith("PT"):
-                                            try:
-                                                # Simple parser for -PT<N>M or -PT<N>H format
-                                                is_negative = trigger_val.startswith("-")
-                                                clean = trigger_val.lstrip("-PT").rstrip("HMS")
-                                                if "H" in trigger_val:
-                                                    hours = int(clean)
-                                                    delta = timedelta(hours=hours)
-                                                elif "M" in trigger_val:
-                                                    minutes = int(clean)
-                                                    delta = timedelta(minutes=minutes)
-                                                else:
-                                                    delta = timedelta(0)
-                                                if is_negative:
-                                                    delta = -delta
-                                                alarm_dt = dtstart + delta
-                                                alarms.append(alarm_dt.isoformat())
-                                            except Exception:
-                                                pass
-                                fallback_events.append({
-                                    "uid": uid,
-                                    "title": summary,
-                                    "start_time": dtstart.isoformat(),
-                                    "end_time": dtend.isoformat(),
-                                    "attendees": attendees,
-                                    "description": description,
-                                    "location": location,
-                                    "organizer": organizer,
-                                    "status": status,
-                                    "alarms": alarms,
-                                    "rrule": rrule_text,
-                                    "exdate": exdates,
-                                })
+                    fallback_events = _scan_vevents(ical_blocks)
                     if fallback_events:
                         events.extend(fallback_events)
                         logger.info(f"Regex fallback extracted {len(fallback_events)} VEVENT(s)")
@@ -851,23 +993,22 @@ class CalDAVManager:
                 except Exception as rex_e:
                     logger.debug(f"Regex fallback failed: {rex_e}")
         except Exception as e:
-            logger.error(f"Error parsing CalDAV events XML: {e}")
+            logger.error(f"Error parsing CalDAV events: {e}")
         return events
     
     async def get_raw_caldav(self, start: datetime, end: datetime) -> str:
         """Получить RAW CalDAV REPORT ответы (для диагностики)."""
         try:
             # Нормализуем диапазон как в get_events
-            tz_localize = pytz.timezone(Config.TZ)
             try:
                 if start.tzinfo is None:
-                    start = tz_localize.localize(start)
+                    start = start.replace(tzinfo=_TZ)
                 else:
-                    start = start.astimezone(tz_localize)
+                    start = start.astimezone(_TZ)
                 if end.tzinfo is None:
-                    end = tz_localize.localize(end)
+                    end = end.replace(tzinfo=_TZ)
                 else:
-                    end = end.astimezone(tz_localize)
+                    end = end.astimezone(_TZ)
             except Exception:
                 pass
 
@@ -882,23 +1023,17 @@ class CalDAVManager:
                 "Content-Type": "application/xml; charset=utf-8",
             }
 
-            raw_blocks: List[str] = []
-            for cal in calendars:
-                cal_href = cal.get("href")
-                if not cal_href:
-                    continue
-                if cal_href.startswith('/'):
-                    cal_url = self.base_url.rstrip('/') + cal_href
-                else:
-                    cal_url = cal_href
+            async def _report_one(cal_url: str) -> str:
                 try:
                     async with session.request("REPORT", cal_url, data=body, headers=headers) as resp:
                         text = await resp.text()
-                        raw_blocks.append(
-                            f"<!-- href={cal_url} status={resp.status} len={len(text)} -->\n{text}"
-                        )
+                        return f"<!-- href={cal_url} status={resp.status} len={len(text)} -->\n{text}"
                 except Exception as req_err:
-                    raw_blocks.append(f"<!-- href={cal_url} error={req_err} -->")
+                    return f"<!-- href={cal_url} error={req_err} -->"
+
+            # Календари запрашиваются параллельно; gather сохраняет их порядок
+            cal_urls = [cal.get("href") for cal in calendars if cal.get("href")]
+            raw_blocks: List[str] = list(await asyncio.gather(*(_report_one(url) for url in cal_urls)))
 
             if not raw_blocks:
                 return "Empty response"
@@ -910,5 +1045,16 @@ class CalDAVManager:
     @staticmethod
     def hash_event(event: Dict) -> str:
         """Создать хэш события для отслеживания изменений"""
-        event_str = json.dumps(event, sort_keys=True, default=str)
-        return hashlib.md5(event_str.encode()).hexdigest()
+        # Поля подаются в хэш по одному — без промежуточной JSON-строки всего события
+        h = hashlib.blake2b(digest_size=16)
+        update = h.update
+        for key in CalDAVManager._HASH_FIELDS:
+            update(str(event.get(key) or '').encode())
+            update(b'\x00')
+        for key in CalDAVManager._HASH_LIST_FIELDS:
+            # Порядок участников/дат на сервере не значим
+            for item in sorted(event.get(key) or ()):
+                update(str(item).encode())
+                update(b'\x01')
+            update(b'\x00')
+        return h.hexdigest()
@@ -8,6 +8,7 @@ class Config:
     MATTERMOST_BASE_URL = os.getenv("MATTERMOST_BASE_URL", "https://wave.loop.ru")
     MATTERMOST_BOT_TOKEN = os.getenv("MATTERMOST_BOT_TOKEN", "")
     MM_ACTIONS_URL = os.getenv("MM_ACTIONS_URL", "https://cb.wave-solutions.ru")
+    MM_POOL_SIZE = int(os.getenv("MM_POOL_SIZE", "4"))  # keep-alive соединений к API, прогреваемых при старте (не лимит пула)
     
     # CalDAV
     CALDAV_BASE_URL = os.getenv("CALDAV_BASE_URL", "https://calendar.mail.ru")
@@ -26,6 +27,7 @@ class Config:
     CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL", "60"))  # seconds
     REMINDER_MINUTES = int(os.getenv("REMINDER_MINUTES", "15"))  # minutes
     DAILY_DIGEST_HOUR = int(os.getenv("DAILY_DIGEST_HOUR", "9"))  # hour in TZ
+    MAX_CONCURRENT_USERS = int(os.getenv("MAX_CONCURRENT_USERS", "50"))  # пользователей, проверяемых параллельно
 
     # Debug flags
     CALDAV_LOG_FULL_RAW = os.getenv("CALDAV_LOG_FULL_RAW", "1") == "1"  # Включить полный вывод REPORT XML
@@ -1,6 +1,9 @@
-from sqlalchemy import create_engine, Column, String, DateTime, Integer, Text, Boolean, Date
-from sqlalchemy.orm import declarative_base, sessionmaker
-from datetime import datetime
+from sqlalchemy import create_engine, event, func, Column, String, DateTime, Integer, Text, Boolean, Date, LargeBinary, Index
+from sqlalchemy.orm import declarative_base, scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
 import os
 
 Base = declarative_base()
@@ -13,8 +16,26 @@ class User(Base):
     mattermost_id = Column(String(50), primary_key=True)
     email = Column(String(255), nullable=False, unique=True)
     encrypted_password = Column(String(500), nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Метки времени ставит сама SQLite (CURRENT_TIMESTAMP в тексте INSERT/UPDATE), а не Python на каждую строку
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
+@dataclass(frozen=True, slots=True)
+class UserSnapshot:
+    """Неизменяемый снимок пользователя для цикла уведомлений"""
+    mattermost_id: str
+    email: str
+    encrypted_password: str
+
+
+@dataclass(frozen=True, slots=True)
+class UserStateSnapshot:
+    """Неизменяемый снимок состояния диалога (только для чтения)"""
+    mattermost_id: str
+    state: Optional[str]
+    data: Optional[bytes]
+    message_id: Optional[str]
 
 
 class UserState(Base):
@@ -23,15 +44,20 @@ class UserState(Base):
     
     mattermost_id = Column(String(50), primary_key=True)
     state = Column(String(50))  # e.g., 'awaiting_title', 'awaiting_date', etc.
-    data = Column(Text)  # JSON с данными для встречи
+    data = Column(LargeBinary)  # msgpack с данными для встречи (старые записи — JSON-строка)
     message_id = Column(String(50))  # ID сообщения для обновления
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
 
 class MeetingCache(Base):
     """Кэш встреч для отслеживания изменений"""
     __tablename__ = "meeting_cache"
+    # Выборки кэша идут по (user_id, uid) и по окну (user_id, start_time)
+    __table_args__ = (
+        Index('ix_meeting_user_uid', 'user_id', 'uid'),
+        Index('ix_meeting_user_start', 'user_id', 'start_time'),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(String(50), nullable=False)
@@ -45,8 +71,18 @@ class MeetingCache(Base):
     attendees = Column(Text)  # JSON список участников
     status = Column(String(20))  # CONFIRMED, CANCELLED, TENTATIVE
     hash_value = Column(String(100))  # Хэш для отслеживания изменений
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
+class TodayMeetingsCache(Base):
+    """Снимок встреч пользователя на день (переживает перезапуск бота)"""
+    __tablename__ = "today_meetings_cache"
+
+    user_id = Column(String(50), primary_key=True)
+    day = Column(Date, primary_key=True)
+    payload = Column(LargeBinary, nullable=False)  # msgpack списка нормализованных встреч
+    fetched_at = Column(DateTime, nullable=False)
 
 
 class DailyDigestLog(Base):
@@ -56,7 +92,7 @@ class DailyDigestLog(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(String(50), nullable=False, index=True)
     digest_date = Column(Date, nullable=False, index=True)
-    sent_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, default=func.now())
 
 
 class DatabaseManager:
@@ -65,12 +101,52 @@ class DatabaseManager:
         # Убедимся, что директория существует
         os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
         
-        self.engine = create_engine(f"sqlite:///{db_path}")
+        # Локальный файл SQLite: pre-ping соединений из пула не нужен
+        self.engine = create_engine(f"sqlite:///{db_path}", poolclass=QueuePool,
+                                    pool_size=5, pool_pre_ping=False)
+        # WAL: чтение из цикла уведомлений не блокирует запись из диалогов
+        event.listen(self.engine, "connect", self._set_sqlite_pragmas)
         Base.metadata.create_all(self.engine)
-        self.Session = sessionmaker(bind=self.engine)
+        # create_all не добавляет индексы в уже существующие таблицы
+        for index in MeetingCache.__table__.indexes:
+            index.create(self.engine, checkfirst=True)
+        self.Session = sessionmaker(bind=self.engine, expire_on_commit=False)
+        # Одна сессия на поток: get_session()/close() не открывают новое соединение каждый раз
+        self._scoped = scoped_session(self.Session)
+    
+    @staticmethod
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+            cursor.execute("PRAGMA mmap_size=268435456")
+        finally:
+            cursor.close()
     
     def get_session(self):
+        return self._scoped()
+    
+    @contextmanager
+    def session_scope(self):
+        """Транзакция в общей сессии потока без её закрытия.
+
+        Сессия не закрывается и не очищается: объекты, на которые ещё есть
+        ссылки, session.get() берёт из identity map без запроса к БД.
+        """
+        session = self._scoped()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+    
+    def new_session(self):
+        """Отдельная (не thread-local) сессия для долгоживущих потребителей"""
         return self.Session()
     
     def close(self):
+        self._scoped.remove()
         self.engine.dispose()
@@ -5,13 +5,21 @@ import hashlib
 
 
 class EncryptionManager:
-    def __init__(self):
-        # Валидируем и используем ключ из конфига
-        try:
-            self.cipher = Fernet(Config.ENCRYPTION_KEY.encode())
-        except Exception:
-            # Если ключ невалиден, генерируем новый
-            self.cipher = Fernet(Fernet.generate_key())
+    # Один экземпляр на процесс: Fernet создаётся один раз, и все пользователи
+    # класса шифруют одним ключом (в том числе сгенерированным при невалидном)
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            instance = super().__new__(cls)
+            # Валидируем и используем ключ из конфига
+            try:
+                instance.cipher = Fernet(Config.ENCRYPTION_KEY.encode())
+            except Exception:
+                # Если ключ невалиден, генерируем новый
+                instance.cipher = Fernet(Fernet.generate_key())
+            cls._instance = instance
+        return cls._instance
     
     def encrypt(self, data: str) -> str:
         """Зашифровать строку"""
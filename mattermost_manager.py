@@ -1,26 +1,43 @@
+import asyncio
 import aiohttp
-from typing import List, Dict, Optional
-import json
+from typing import List, Dict, Optional, Tuple
 import logging
+import orjson
 
 logger = logging.getLogger(__name__)
 
 
 class MattermostManager:
-    def __init__(self, base_url: str, token: str, bot_name: str):
+    def __init__(self, base_url: str, token: str, bot_name: str, pool_size: int = 4):
         """Инициализация менеджера Mattermost через HTTP API"""
         self.base_url = base_url.rstrip('/')
+        # Адреса API собираются один раз, а не f-строкой в каждом запросе
+        api = f"{self.base_url}/api/v4"
+        self._url_me = f"{api}/users/me"
+        self._url_my_channels = f"{api}/users/me/channels"
+        self._url_users_by_name = f"{api}/users/username/"
+        self._url_direct = f"{api}/channels/direct"
+        self._url_posts = f"{api}/posts"
         self.token = token
         self.bot_name = bot_name
+        self.pool_size = max(1, pool_size)
         self.user = None
         self.session = None
+        # Одновременных отправок сообщений не больше 10 (всплески напоминаний)
+        self._send_sem = asyncio.Semaphore(10)
+        # user_id -> ID прямого канала с ботом
+        self._channel_ids: Dict[str, str] = {}
         # Для совместимости со старым кодом
         self.driver = self
     
     async def _ensure_session(self):
         """Создать session если необходимо"""
         if self.session is None or self.session.closed:
-            self.session = aiohttp.ClientSession()
+            # ssl и заголовки задаются один раз на connector/session, а не в каждом запросе;
+            # limit — по умолчанию aiohttp, pool_size только число прогреваемых соединений
+            connector = aiohttp.TCPConnector(keepalive_timeout=300,
+                                             ttl_dns_cache=300, ssl=False)
+            self.session = aiohttp.ClientSession(connector=connector, headers=self._get_headers())
         return self.session
     
     def _get_headers(self) -> Dict:
@@ -34,13 +51,9 @@ class MattermostManager:
         """Проверить подключение к Mattermost"""
         try:
             session = await self._ensure_session()
-            async with session.get(
-                f"{self.base_url}/api/v4/users/me",
-                headers=self._get_headers(),
-                ssl=False
-            ) as resp:
+            async with session.get(self._url_me) as resp:
                 if resp.status == 200:
-                    self.user = await resp.json()
+                    self.user = orjson.loads(await resp.read())
                     logger.info(f"Connected to Mattermost as {self.user.get('username')}")
                     return True
                 else:
@@ -50,6 +63,21 @@ class MattermostManager:
             logger.error(f"Error connecting to Mattermost: {e}")
             return False
     
+    async def warm_up(self) -> int:
+        """Заранее открыть pool_size keep-alive соединений к API"""
+        session = await self._ensure_session()
+
+        async def _ping() -> bool:
+            async with session.get(self._url_me) as resp:
+                await resp.read()
+                return resp.status == 200
+
+        results = await asyncio.gather(*(_ping() for _ in range(self.pool_size)),
+                                       return_exceptions=True)
+        warmed = sum(1 for r in results if r is True)
+        logger.info(f"Mattermost connection pool warmed: {warmed}/{self.pool_size}")
+        return warmed
+    
     async def disconnect(self):
         """Отключиться от Mattermost"""
         if self.session and not self.session.closed:
@@ -77,13 +105,9 @@ class MattermostManager:
         """Получить информацию о пользователе по username"""
         try:
             session = await self._ensure_session()
-            async with session.get(
-                f"{self.base_url}/api/v4/users/username/{username}",
-                headers=self._get_headers(),
-                ssl=False
-            ) as resp:
+            async with session.get(self._url_users_by_name + username) as resp:
                 if resp.status == 200:
-                    return await resp.json()
+                    return orjson.loads(await resp.read())
                 return None
         except Exception as e:
             logger.error(f"Error getting user {username}: {e}")
@@ -95,13 +119,11 @@ class MattermostManager:
             session = await self._ensure_session()
             # Создать или получить прямой канал
             async with session.post(
-                f"{self.base_url}/api/v4/channels/direct",
-                headers=self._get_headers(),
-                json=[user_id],
-                ssl=False
+                self._url_direct,
+                data=orjson.dumps([user_id])
             ) as resp:
                 if resp.status == 201:
-                    channel = await resp.json()
+                    channel = orjson.loads(await resp.read())
                     return channel.get('id')
                 return None
         except Exception as e:
@@ -121,20 +143,24 @@ class MattermostManager:
             if root_id:
                 post_data['root_id'] = root_id
             
-            async with session.post(
-                f"{self.base_url}/api/v4/posts",
-                headers=self._get_headers(),
-                json=post_data,
-                ssl=False
-            ) as resp:
-                if resp.status == 201:
-                    response = await resp.json()
-                    return response.get('id')
-                return None
+            async with self._send_sem:
+                async with session.post(
+                    self._url_posts,
+                    data=orjson.dumps(post_data)
+                ) as resp:
+                    if resp.status == 201:
+                        response = orjson.loads(await resp.read())
+                        return response.get('id')
+                    return None
         except Exception as e:
             logger.error(f"Error sending message: {e}")
             return None
     
+    async def send_many(self, messages: List[Tuple[str, str, Optional[Dict]]]) -> List[Optional[str]]:
+        """Отправить несколько сообщений (channel_id, message, props) параллельно"""
+        return await asyncio.gather(*(self.send_message(channel_id, message, props)
+                                      for channel_id, message, props in messages))
+    
     async def update_message(self, post_id: str, message: str, props: Dict = None) -> bool:
         """Обновить сообщение"""
         try:
@@ -147,10 +173,8 @@ class MattermostManager:
                 update_data['props'] = props
             
             async with session.put(
-                f"{self.base_url}/api/v4/posts/{post_id}",
-                headers=self._get_headers(),
-                json=update_data,
-                ssl=False
+                f"{self._url_posts}/{post_id}",
+                data=orjson.dumps(update_data)
             ) as resp:
                 return resp.status == 200
         except Exception as e:
@@ -158,23 +182,56 @@ class MattermostManager:
             return False
     
     async def create_post_with_attachments(self, channel_id: str, message: str, 
-                                          attachments: List[Dict]) -> Optional[str]:
-        """Отправить сообщение с интерактивными элементами"""
-        props = {'attachments': attachments}
-        return await self.send_message(channel_id, message, props)
+                                          attachments: List[Dict] = None,
+                                          attachments_json: str = None) -> Optional[str]:
+        """Отправить сообщение с интерактивными элементами.
+
+        attachments_json — уже сериализованный список вложений (готовый шаблон),
+        он вставляется в тело запроса без повторной сериализации.
+        """
+        if attachments_json is None:
+            props = {'attachments': attachments or []}
+            return await self.send_message(channel_id, message, props)
+        body = (
+            b'{"channel_id":' + orjson.dumps(channel_id)
+            + b',"message":' + orjson.dumps(message)
+            + b',"props":{"attachments":' + attachments_json.encode('utf-8') + b'}}'
+        )
+        return await self._send_raw_post(body)
+    
+    async def _send_raw_post(self, body: bytes) -> Optional[str]:
+        """Отправить готовое JSON-тело поста"""
+        try:
+            session = await self._ensure_session()
+            async with session.post(
+                self._url_posts,
+                data=body
+            ) as resp:
+                if resp.status == 201:
+                    response = orjson.loads(await resp.read())
+                    return response.get('id')
+                return None
+        except Exception as e:
+            logger.error(f"Error sending message: {e}")
+            return None
     
     async def get_channel_id(self, user_id: str) -> Optional[str]:
-        """Получить канал для личного сообщения"""
+        """Получить канал для личного сообщения (ID прямого канала не меняется — кэшируется)"""
+        channel_id = self._channel_ids.get(user_id)
+        if channel_id is None:
+            channel_id = await self._find_channel_id(user_id)
+            if channel_id:
+                self._channel_ids[user_id] = channel_id
+        return channel_id
+    
+    async def _find_channel_id(self, user_id: str) -> Optional[str]:
+        """Найти (или создать) прямой канал с пользователем через API"""
         try:
             session = await self._ensure_session()
             # Получить список каналов пользователя
-            async with session.get(
-                f"{self.base_url}/api/v4/users/me/channels",
-                headers=self._get_headers(),
-                ssl=False
-            ) as resp:
+            async with session.get(self._url_my_channels) as resp:
                 if resp.status == 200:
-                    channels = await resp.json()
+                    channels = orjson.loads(await resp.read())
                     # Ищем прямой канал с этим пользователем
                     for channel in channels:
                         if channel['type'] == 'D' and user_id in channel.get('name', ''):
@@ -201,13 +258,11 @@ class MattermostManager:
                 update_data['props'] = {}
             
             async with session.put(
-                f"{self.base_url}/api/v4/posts/{post_id}",
-                headers=self._get_headers(),
-                json=update_data,
-                ssl=False
+                f"{self._url_posts}/{post_id}",
+                data=orjson.dumps(update_data)
             ) as resp:
                 if resp.status == 200:
-                    return await resp.json()
+                    return orjson.loads(await resp.read())
                 return None
         except Exception as e:
             logger.error(f"Error updating post: {e}")
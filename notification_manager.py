@@ -1,122 +1,183 @@
+import asyncio
 import logging
 from datetime import datetime, timedelta
-import json
-from typing import List, Dict, Iterable
-import pytz
+import orjson
+from collections import defaultdict
+from typing import List, Dict, Iterable, Optional, Tuple
+from zoneinfo import ZoneInfo
+from sqlalchemy import bindparam, select
 from config import Config
 from database import DatabaseManager, MeetingCache, DailyDigestLog
-from encryption import EncryptionManager
 from caldav_manager import CalDAVManager
 from mattermost_manager import MattermostManager
 from ui_messages import UIMessages
 
 logger = logging.getLogger(__name__)
 
+try:
+    # C-парсер ISO 8601; без него — стандартный fromisoformat
+    from ciso8601 import parse_datetime as _parse_iso
+except ImportError:
+    _parse_iso = datetime.fromisoformat
+
+# Core-выражения для кэша встреч строятся один раз: без ORM identity map,
+# скомпилированная форма берётся из кэша запросов SQLAlchemy
+_MEETINGS = MeetingCache.__table__
+_SELECT_CACHE_KEYS = select(_MEETINGS.c.uid, _MEETINGS.c.id, _MEETINGS.c.hash_value, _MEETINGS.c.status).where(
+    _MEETINGS.c.user_id == bindparam('b_user_id'),
+    _MEETINGS.c.uid.in_(bindparam('b_uids', expanding=True))
+)
+_INSERT_CACHE = _MEETINGS.insert()
+# Размер порции user_id в IN (...) при пакетной загрузке кэша
+_BULK_IN_CHUNK = 500
+_UPDATE_CACHE = _MEETINGS.update().where(_MEETINGS.c.id == bindparam('b_id'))
+_CANCEL_CACHE = _MEETINGS.update().where(
+    _MEETINGS.c.user_id == bindparam('b_user_id'),
+    _MEETINGS.c.uid == bindparam('b_uid')
+).values(status='CANCELLED')
+
 
 class NotificationManager:
     def __init__(self, db: DatabaseManager, mm: MattermostManager, logic):
         self.db = db
         self.mm = mm
         self.logic = logic
-        self.encryption = EncryptionManager()
-        self.tz = pytz.timezone(Config.TZ)
+        self.tz = ZoneInfo(Config.TZ)
+        # Сколько пользователей проверяется параллельно (одновременных CalDAV-запросов)
+        self._concurrency = max(1, Config.MAX_CONCURRENT_USERS)
+        # Кому уже отправлен дайджест за _digest_sent_day: одна выборка в день вместо запроса на каждом тике
+        self._digest_sent_day = None
+        self._digest_sent_users = set()
     
     async def check_and_notify(self, users: List) -> int:
         """
         Проверить изменения встреч и отправить уведомления
         Возвращает количество отправленных уведомлений
         """
-        notification_count = 0
-        
-        for user in users:
-            try:
-                # Получить пароль пользователя
-                password = self.encryption.decrypt(user.encrypted_password)
-                if not password:
-                    logger.warning(f"Could not decrypt password for user {user.mattermost_id}")
-                    continue
-                
-                # Создать менеджер CalDAV
-                caldav_manager = CalDAVManager(user.email, password)
-                try:
-                    # Получить встречи на сегодня и завтра
-                    today = datetime.now(self.tz).replace(hour=0, minute=0, second=0, microsecond=0)
-                    tomorrow = today + timedelta(days=1)
-                    tomorrow_end = tomorrow.replace(hour=23, minute=59, second=59)
-
-                    # Получить события из CalDAV
-                    current_events = await caldav_manager.get_events(today, tomorrow_end)
-                    current_events_map: Dict[str, Dict] = {
-                        ev.get('uid', ''): ev for ev in current_events if ev.get('uid')
-                    }
-                    request_ok = getattr(caldav_manager, "last_events_ok", bool(current_events_map))
-                    if not request_ok:
-                        logger.warning(
-                            "CalDAV request for %s returned only error statuses; skip cancellation detection (statuses=%s)",
-                            user.email,
-                            getattr(caldav_manager, "last_events_statuses", [])
-                        )
+        sem = asyncio.Semaphore(self._concurrency)
+        today, tomorrow_end = self._check_window()
+        # Кэш встреч всех пользователей — одним запросом вместо запроса на каждого
+        cached_by_user = self._get_cached_events_map_bulk(
+            [u.mattermost_id for u in users], today, tomorrow_end
+        )
 
-                    # Получить кэшированные события
-                    cached_events_map = self._get_cached_events_map(user.mattermost_id, today, tomorrow_end)
-
-                    # Сравнить текущие данные с кэшем
-                    relevant_current_uids = set()
-                    for uid, event in current_events_map.items():
-                        if not self._is_today_or_tomorrow(event, today):
-                            continue
-                        relevant_current_uids.add(uid)
-                        current_status = (event.get('status') or 'CONFIRMED').upper()
-                        cached = cached_events_map.get(uid)
-
-                        if not cached:
-                            if current_status != 'CANCELLED':
-                                await self._notify_new_meeting(user, event)
-                                notification_count += 1
-                            continue
-
-                        cached_status = (cached.status or '').upper()
-                        if cached_status == 'CANCELLED' and current_status != 'CANCELLED':
-                            await self._notify_new_meeting(user, event)
-                            notification_count += 1
-                        elif cached_status != 'CANCELLED' and current_status == 'CANCELLED':
-                            await self._notify_cancelled_meeting(user, cached)
-                            notification_count += 1
-                        elif current_status != 'CANCELLED' and self._event_changed_time(cached, event):
-                            await self._notify_rescheduled_meeting(user, cached, event)
-                            notification_count += 1
-
-                    if request_ok and cached_events_map:
-                        missing_uids = set(cached_events_map.keys()) - relevant_current_uids
-                        for missing_uid in missing_uids:
-                            cached = cached_events_map.get(missing_uid)
-                            if not cached:
-                                continue
-                            cached_status = (cached.status or '').upper()
-                            if cached_status == 'CANCELLED':
-                                continue
-                            await self._notify_cancelled_meeting(user, cached)
-                            self._mark_event_cancelled(user.mattermost_id, missing_uid)
-                            notification_count += 1
-
-                    # Обновить кэш (по имеющимся событиям)
-                    self._update_events_cache(user.mattermost_id, current_events_map.values())
-
-                    # Проверить напоминания
-                    reminders_sent = await self._check_reminders(user, list(current_events_map.values()))
-                    notification_count += reminders_sent
-                finally:
-                    try:
-                        await caldav_manager.close()
-                    except Exception:
-                        pass
+        async def one(user) -> int:
+            async with sem:
+                return await self.check_and_notify_one(user, cached_by_user.get(user.mattermost_id, {}))
 
-                digest_sent = await self._maybe_send_daily_digest(user, password)
-                notification_count += digest_sent
+        results = await asyncio.gather(*(one(u) for u in users), return_exceptions=True)
+        return sum(r for r in results if isinstance(r, int))
+
+    def _check_window(self) -> Tuple[datetime, datetime]:
+        """Окно проверки: с начала сегодняшнего дня до конца завтрашнего"""
+        today = datetime.now(self.tz).replace(hour=0, minute=0, second=0, microsecond=0)
+        tomorrow = today + timedelta(days=1)
+        return today, tomorrow.replace(hour=23, minute=59, second=59)
+
+    async def check_and_notify_one(self, user, cached_events_map: Optional[Dict[str, MeetingCache]] = None) -> int:
+        """Проверить одного пользователя; возвращает число отправленных уведомлений.
+
+        cached_events_map — заранее загруженный кэш встреч пользователя (см. check_and_notify).
+        """
+        notification_count = 0
+        try:
+            # Получить пароль пользователя (кэш BotLogic по шифротексту — без Fernet на каждом тике)
+            password = self.logic.decrypt_user_password(user)
+            if not password:
+                logger.warning(f"Could not decrypt password for user {user.mattermost_id}")
+                return 0
             
-            except Exception as e:
-                logger.error(f"Error checking notifications for user {user.mattermost_id}: {e}")
+            # CalDAV-менеджер из пула BotLogic: кэш календарей и keep-alive сессия живут между тиками
+            caldav_manager = self.logic.get_caldav(user.mattermost_id, user.email, password)
+            # Получить встречи на сегодня и завтра
+            today, tomorrow_end = self._check_window()
+
+            # Получить события из CalDAV
+            current_events, request_ok = await caldav_manager.get_events(today, tomorrow_end)
+            current_events_map: Dict[str, Dict] = {
+                ev.get('uid', ''): ev for ev in current_events if ev.get('uid')
+            }
+            if not request_ok:
+                logger.warning(
+                    "CalDAV request for %s failed; skip cancellation detection",
+                    user.email,
+                )
+
+            # Получить кэшированные события (если не загружены пачкой заранее)
+            if cached_events_map is None:
+                cached_events_map = self._get_cached_events_map(user.mattermost_id, today, tomorrow_end)
+
+            # Сравнить текущие данные с кэшем; уведомления копятся и уходят одной параллельной пачкой
+            outbox: List[Tuple[str, str, None]] = []
+            # Даты окна считаются один раз на пользователя, а не на каждое событие
+            today_date = today.date()
+            tomorrow_date = tomorrow_end.date()
+            relevant_events = {
+                uid: event for uid, event in current_events_map.items()
+                if self._event_times(event)[0].date() in (today_date, tomorrow_date)
+            }
+            # Разбиение по множествам: новые, общие с кэшем и пропавшие UID
+            current_uids = frozenset(relevant_events)
+            cached_uids = frozenset(cached_events_map)
+
+            for uid in current_uids - cached_uids:
+                event = relevant_events[uid]
+                if (event.get('status') or 'CONFIRMED').upper() != 'CANCELLED':
+                    await self._notify_new_meeting(user, event, outbox)
+                    notification_count += 1
+
+            for uid in current_uids & cached_uids:
+                event = relevant_events[uid]
+                cached = cached_events_map[uid]
+                current_cancelled = (event.get('status') or 'CONFIRMED').upper() == 'CANCELLED'
+                cached_cancelled = (cached.status or '').upper() == 'CANCELLED'
+                if cached_cancelled and not current_cancelled:
+                    await self._notify_new_meeting(user, event, outbox)
+                    notification_count += 1
+                elif current_cancelled and not cached_cancelled:
+                    await self._notify_cancelled_meeting(user, cached, outbox)
+                    notification_count += 1
+                elif not current_cancelled and self._event_changed_time(cached, event):
+                    await self._notify_rescheduled_meeting(user, cached, event, outbox)
+                    notification_count += 1
+
+            # Отметки об отмене пишутся вместе с обновлением кэша, одной транзакцией
+            cancelled_uids: List[str] = []
+            if request_ok:
+                for missing_uid in cached_uids - current_uids:
+                    cached = cached_events_map[missing_uid]
+                    if (cached.status or '').upper() == 'CANCELLED':
+                        continue
+                    await self._notify_cancelled_meeting(user, cached, outbox)
+                    cancelled_uids.append(missing_uid)
+                    notification_count += 1
+
+            if outbox:
+                post_ids = await self.mm.send_many(outbox)
+                sent = sum(1 for post_id in post_ids if post_id)
+                if sent < len(outbox):
+                    logger.warning(f"Sent {sent}/{len(outbox)} change notifications to {user.mattermost_id}")
+                else:
+                    logger.info(f"Sent {sent} change notifications to {user.mattermost_id}")
+
+            if notification_count:
+                # Встречи изменились — список «на сегодня» надо перечитать
+                self.logic.invalidate_today_meetings(user.mattermost_id)
+
+            # Обновить кэш (по имеющимся событиям)
+            self._update_events_cache(user.mattermost_id, current_events_map.values(), cached_events_map,
+                                      cancelled_uids)
+
+            # Проверить напоминания
+            reminders_sent = await self._check_reminders(user, list(current_events_map.values()))
+            notification_count += reminders_sent
+
+            digest_sent = await self._maybe_send_daily_digest(user, password)
+            notification_count += digest_sent
         
+        except Exception as e:
+            logger.error(f"Error checking notifications for user {user.mattermost_id}: {e}")
+
         return notification_count
     
     def _get_cached_events_map(self, user_id: str, start_date: datetime, 
@@ -133,27 +194,54 @@ class NotificationManager:
         finally:
             session.close()
     
+    def _get_cached_events_map_bulk(self, user_ids: List[str], start_date: datetime,
+                                    end_date: datetime) -> Dict[str, Dict[str, MeetingCache]]:
+        """Кэшированные события нескольких пользователей (user_id -> UID -> MeetingCache)."""
+        by_user: Dict[str, Dict[str, MeetingCache]] = defaultdict(dict)
+        if not user_ids:
+            return by_user
+        session = self.db.get_session()
+        try:
+            # Порциями: у SQLite ограничено число параметров запроса
+            for i in range(0, len(user_ids), _BULK_IN_CHUNK):
+                events = session.query(MeetingCache).filter(
+                    MeetingCache.user_id.in_(user_ids[i:i + _BULK_IN_CHUNK]),
+                    MeetingCache.start_time >= start_date,
+                    MeetingCache.start_time <= end_date
+                ).all()
+                for evt in events:
+                    if evt.uid:
+                        by_user[evt.user_id][evt.uid] = evt
+            return by_user
+        finally:
+            session.close()
+    
+    def _event_times(self, event: Dict) -> Tuple[datetime, datetime]:
+        """Начало и конец события в self.tz.
+
+        Строки ISO разбираются один раз и сохраняются в словаре события (_start_dt/_end_dt):
+        сравнение с кэшем, напоминания и уведомления берут уже готовые datetime.
+        """
+        start = event.get('_start_dt')
+        if start is None:
+            start = event['_start_dt'] = self._local_dt(event.get('start_time', ''))
+            event['_end_dt'] = self._local_dt(event.get('end_time', ''))
+        return start, event['_end_dt']
+
+    def _local_dt(self, value: str) -> datetime:
+        """ISO-строка -> aware datetime в self.tz"""
+        dt = _parse_iso(value)
+        return dt.astimezone(self.tz) if dt.tzinfo else dt.replace(tzinfo=self.tz)
+
     def _event_changed_time(self, cached: MeetingCache, current: Dict) -> bool:
         """Проверить, изменилось ли время события"""
         try:
             tz_local = self.tz
-            current_start_raw = current.get('start_time', '')
-            current_end_raw = current.get('end_time', '')
-            if not current_start_raw or not current_end_raw:
+            if not current.get('start_time') or not current.get('end_time'):
                 return False
-            current_start = datetime.fromisoformat(current_start_raw)
-            current_end = datetime.fromisoformat(current_end_raw)
-            # Нормализуем в локальный TZ (если присутствует другой)
-            if current_start.tzinfo:
-                current_start = current_start.astimezone(tz_local)
-            else:
-                current_start = tz_local.localize(current_start)
-            if current_end.tzinfo:
-                current_end = current_end.astimezone(tz_local)
-            else:
-                current_end = tz_local.localize(current_end)
-            cached_start = cached.start_time.astimezone(tz_local) if cached.start_time.tzinfo else tz_local.localize(cached.start_time)
-            cached_end = cached.end_time.astimezone(tz_local) if cached.end_time.tzinfo else tz_local.localize(cached.end_time)
+            current_start, current_end = self._event_times(current)
+            cached_start = cached.start_time.astimezone(tz_local) if cached.start_time.tzinfo else cached.start_time.replace(tzinfo=tz_local)
+            cached_end = cached.end_time.astimezone(tz_local) if cached.end_time.tzinfo else cached.end_time.replace(tzinfo=tz_local)
             # Сравниваем с точностью до минуты (секунды/микросекунды игнорируем)
             cached_start_min = cached_start.replace(second=0, microsecond=0)
             cached_end_min = cached_end.replace(second=0, microsecond=0)
@@ -168,52 +256,75 @@ class NotificationManager:
             # В случае ошибки не шлем уведомление о переносе
             return False
     
-    def _is_today_or_tomorrow(self, event: Dict, today: datetime) -> bool:
-        """Проверить, событие ли это на сегодня или завтра"""
-        start_time = datetime.fromisoformat(event.get('start_time', ''))
-        tomorrow = today + timedelta(days=1)
-        
-        return start_time.date() in [today.date(), tomorrow.date()]
-    
-    def _update_events_cache(self, user_id: str, events: Iterable[Dict]):
-        """Обновить/добавить записи кэша по событиям без удаления остальных."""
-        session = self.db.get_session()
-        try:
-            for event in events:
-                uid = event.get('uid')
-                if not uid:
+    def _update_events_cache(self, user_id: str, events: Iterable[Dict],
+                             known: Optional[Dict[str, MeetingCache]] = None,
+                             cancelled_uids: Iterable[str] = ()):
+        """Обновить/добавить записи кэша по событиям без удаления остальных.
+
+        known — уже загруженные записи кэша (UID -> MeetingCache); для них SELECT не нужен.
+        cancelled_uids — пропавшие с сервера события: помечаются отменёнными (чтобы не
+        спамить уведомлениями) в той же транзакции.
+        """
+        cancelled = [{'b_user_id': user_id, 'b_uid': uid} for uid in cancelled_uids]
+        # Сначала только хэш; полные значения (с сериализацией участников) — для изменённых записей
+        hashed_by_uid: Dict[str, Tuple[str, Dict]] = {}
+        for event in events:
+            uid = event.get('uid')
+            if not uid:
+                continue
+            hashed_by_uid[uid] = (CalDAVManager.hash_event(event), event)
+        if not hashed_by_uid and not cancelled:
+            return
+        known = known or {}
+        existing = [(uid, row.id, row.hash_value, row.status)
+                    for uid, row in known.items() if uid in hashed_by_uid]
+        unknown = [uid for uid in hashed_by_uid if uid not in known]
+        with self.db.engine.begin() as conn:
+            if cancelled:
+                conn.execute(_CANCEL_CACHE, cancelled)
+            # Один SELECT ключевых столбцов (uid -> id, хэш, статус) — только для незагруженных UID
+            if unknown:
+                existing.extend(conn.execute(_SELECT_CACHE_KEYS, {'b_user_id': user_id, 'b_uids': unknown}).all())
+            updated: List[Dict] = []
+            for uid, row_id, hash_value, status in existing:
+                hashed = hashed_by_uid.pop(uid, None)
+                if not hashed:
                     continue
-                cache = session.query(MeetingCache).filter_by(user_id=user_id, uid=uid).first()
-                if not cache:
-                    cache = MeetingCache(user_id=user_id, uid=uid)
-                    session.add(cache)
-                cache.title = event.get('title', '')
-                cache.start_time = datetime.fromisoformat(event.get('start_time', ''))
-                cache.end_time = datetime.fromisoformat(event.get('end_time', ''))
-                cache.description = event.get('description', '')
-                cache.location = event.get('location', '')
-                cache.organizer = event.get('organizer', '')
-                cache.attendees = json.dumps(event.get('attendees', []))
-                cache.status = event.get('status', 'CONFIRMED')
-                cache.hash_value = CalDAVManager.hash_event(event)
-            session.commit()
-        finally:
-            session.close()
+                new_hash, event = hashed
+                # Неизменённое событие не переписывается; статус сверяется отдельно —
+                # отметка об отмене (cancelled_uids) меняет его без пересчёта хэша
+                if hash_value == new_hash and status == event.get('status', 'CONFIRMED'):
+                    continue
+                updated.append({'b_id': row_id, **self._cache_values(event, new_hash)})
+            # Изменённые записи — executemany UPDATE по первичному ключу
+            if updated:
+                conn.execute(_UPDATE_CACHE, updated)
+            # Новые записи — одним executemany INSERT
+            if hashed_by_uid:
+                conn.execute(_INSERT_CACHE, [
+                    {'user_id': user_id, 'uid': uid, **self._cache_values(event, new_hash)}
+                    for uid, (new_hash, event) in hashed_by_uid.items()
+                ])
+
+    def _cache_values(self, event: Dict, hash_value: str) -> Dict:
+        """Значения столбцов MeetingCache для события"""
+        start_dt, end_dt = self._event_times(event)
+        return {
+            'title': event.get('title', ''),
+            'start_time': start_dt,
+            'end_time': end_dt,
+            'description': event.get('description', ''),
+            'location': event.get('location', ''),
+            'organizer': event.get('organizer', ''),
+            'attendees': orjson.dumps(event.get('attendees', [])).decode('utf-8'),
+            'status': event.get('status', 'CONFIRMED'),
+            'hash_value': hash_value,
+        }
 
-    def _mark_event_cancelled(self, user_id: str, uid: str):
-        """Пометить событие в кэше как отменённое, чтобы не спамить уведомлениями."""
-        session = self.db.get_session()
-        try:
-            cache = session.query(MeetingCache).filter_by(user_id=user_id, uid=uid).first()
-            if cache:
-                cache.status = 'CANCELLED'
-                session.commit()
-        finally:
-            session.close()
-    
     async def _check_reminders(self, user, events: List[Dict]) -> int:
         """Проверить и отправить напоминания"""
-        reminder_count = 0
+        # Напоминания собираются и отправляются одной параллельной пачкой
+        pending: List[str] = []
         
         try:
             channel_id = await self.mm.get_channel_id(user.mattermost_id)
@@ -224,22 +335,18 @@ class NotificationManager:
             reminder_delta = timedelta(minutes=Config.REMINDER_MINUTES)
             check_window = max(5, Config.CHECK_INTERVAL)
             for event in events:
-                start_time = datetime.fromisoformat(event.get('start_time', ''))
-                if start_time.tzinfo:
-                    start_time = start_time.astimezone(self.tz)
-                else:
-                    start_time = self.tz.localize(start_time)
+                start_time = self._event_times(event)[0]
                 
                 # Check VALARM alarms first
                 alarms = event.get('alarms', [])
                 alarm_triggered = False
                 for alarm_iso in alarms:
                     try:
-                        alarm_dt = datetime.fromisoformat(alarm_iso)
+                        alarm_dt = _parse_iso(alarm_iso)
                         if alarm_dt.tzinfo:
                             alarm_dt = alarm_dt.astimezone(self.tz)
                         else:
-                            alarm_dt = self.tz.localize(alarm_dt)
+                            alarm_dt = alarm_dt.replace(tzinfo=self.tz)
                         # Normalize to minute precision
                         delta_alarm = (alarm_dt - now).total_seconds()
                         if 0 <= delta_alarm < check_window:
@@ -248,8 +355,7 @@ class NotificationManager:
                                 start_time,
                                 event.get('location', '')
                             )
-                            await self.mm.send_message(channel_id, message)
-                            reminder_count += 1
+                            pending.append(message)
                             alarm_triggered = True
                             break  # Only send одно напоминание по VALARM
                     except Exception as alarm_err:
@@ -268,8 +374,7 @@ class NotificationManager:
                             start_time,
                             event.get('location', '')
                         )
-                        await self.mm.send_message(channel_id, message)
-                        reminder_count += 1
+                        pending.append(message)
                         continue
 
                 # Напоминание в момент начала встречи
@@ -280,13 +385,15 @@ class NotificationManager:
                         start_time,
                         event.get('location', '')
                     )
-                    await self.mm.send_message(channel_id, message)
-                    reminder_count += 1
+                    pending.append(message)
         
         except Exception as e:
             logger.error(f"Error checking reminders: {e}")
         
-        return reminder_count
+        # Уже собранные напоминания уходят, даже если разбор следующего события упал
+        if pending:
+            await self.mm.send_many([(channel_id, message, None) for message in pending])
+        return len(pending)
 
     async def _maybe_send_daily_digest(self, user, password: str) -> int:
         """Отправить дайджест в 09:00, если ещё не был отправлен"""
@@ -322,15 +429,15 @@ class NotificationManager:
         return 1
 
     def _digest_already_sent(self, user_id: str, digest_date) -> bool:
-        session = self.db.get_session()
-        try:
-            exists = session.query(DailyDigestLog).filter_by(
-                user_id=user_id,
-                digest_date=digest_date,
-            ).first()
-            return exists is not None
-        finally:
-            session.close()
+        if self._digest_sent_day != digest_date:
+            session = self.db.get_session()
+            try:
+                rows = session.query(DailyDigestLog.user_id).filter_by(digest_date=digest_date).all()
+            finally:
+                session.close()
+            self._digest_sent_users = {row.user_id for row in rows}
+            self._digest_sent_day = digest_date
+        return user_id in self._digest_sent_users
 
     def _mark_digest_sent(self, user_id: str, digest_date):
         session = self.db.get_session()
@@ -340,31 +447,38 @@ class NotificationManager:
             session.commit()
         finally:
             session.close()
+        if self._digest_sent_day == digest_date:
+            self._digest_sent_users.add(user_id)
     
-    async def _notify_new_meeting(self, user, event: Dict):
-        """Отправить уведомление о новой встрече"""
+    async def _notify_new_meeting(self, user, event: Dict, outbox: Optional[List[Tuple]] = None):
+        """Отправить уведомление о новой встрече (с outbox — только поставить в очередь)"""
         try:
             channel_id = await self.mm.get_channel_id(user.mattermost_id)
             if not channel_id:
                 return
             
+            start_time, end_time = self._event_times(event)
             message = UIMessages.new_meeting_notification(
                 event.get('title', ''),
-                datetime.fromisoformat(event.get('start_time', '')),
-                datetime.fromisoformat(event.get('end_time', '')),
+                start_time,
+                end_time,
                 event.get('attendees', []),
                 event.get('description', ''),
                 event.get('location', '')
             )
             
-            await self.mm.send_message(channel_id, message)
-            logger.info(f"Sent new meeting notification to {user.mattermost_id}")
+            if outbox is not None:
+                outbox.append((channel_id, message, None))
+                logger.debug(f"Queued new meeting notification for {user.mattermost_id}")
+            else:
+                await self.mm.send_message(channel_id, message)
+                logger.info(f"Sent new meeting notification to {user.mattermost_id}")
         
         except Exception as e:
             logger.error(f"Error sending new meeting notification: {e}")
     
-    async def _notify_cancelled_meeting(self, user, cached: MeetingCache):
-        """Отправить уведомление об отмене встречи"""
+    async def _notify_cancelled_meeting(self, user, cached: MeetingCache, outbox: Optional[List[Tuple]] = None):
+        """Отправить уведомление об отмене встречи (с outbox — только поставить в очередь)"""
         try:
             channel_id = await self.mm.get_channel_id(user.mattermost_id)
             if not channel_id:
@@ -376,29 +490,39 @@ class NotificationManager:
                 cached.end_time
             )
             
-            await self.mm.send_message(channel_id, message)
-            logger.info(f"Sent cancellation notification to {user.mattermost_id}")
+            if outbox is not None:
+                outbox.append((channel_id, message, None))
+                logger.debug(f"Queued cancellation notification for {user.mattermost_id}")
+            else:
+                await self.mm.send_message(channel_id, message)
+                logger.info(f"Sent cancellation notification to {user.mattermost_id}")
         
         except Exception as e:
             logger.error(f"Error sending cancellation notification: {e}")
     
-    async def _notify_rescheduled_meeting(self, user, cached: MeetingCache, new_event: Dict):
-        """Отправить уведомление о переносе встречи"""
+    async def _notify_rescheduled_meeting(self, user, cached: MeetingCache, new_event: Dict,
+                                          outbox: Optional[List[Tuple]] = None):
+        """Отправить уведомление о переносе встречи (с outbox — только поставить в очередь)"""
         try:
             channel_id = await self.mm.get_channel_id(user.mattermost_id)
             if not channel_id:
                 return
             
+            new_start, new_end = self._event_times(new_event)
             message = UIMessages.meeting_rescheduled(
                 cached.title,
                 cached.start_time,
                 cached.end_time,
-                datetime.fromisoformat(new_event.get('start_time', '')),
-                datetime.fromisoformat(new_event.get('end_time', ''))
+                new_start,
+                new_end
             )
             
-            await self.mm.send_message(channel_id, message)
-            logger.info(f"Sent rescheduled notification to {user.mattermost_id}")
+            if outbox is not None:
+                outbox.append((channel_id, message, None))
+                logger.debug(f"Queued rescheduled notification for {user.mattermost_id}")
+            else:
+                await self.mm.send_message(channel_id, message)
+                logger.info(f"Sent rescheduled notification to {user.mattermost_id}")
         
         except Exception as e:
             logger.error(f"Error sending rescheduled notification: {e}")
@@ -0,0 +1,28 @@
+from types import SimpleNamespace
+from zoneinfo import ZoneInfo
+
+from bot_logic import BotLogic
+
+
+def _validate_date(date_str):
+    return BotLogic.validate_date(SimpleNamespace(tz=ZoneInfo("Europe/Moscow")), date_str)
+
+
+def test_validate_date_accepts_full_format():
+    dt = _validate_date("01.02.2025")
+    assert (dt.year, dt.month, dt.day) == (2025, 2, 1)
+    assert dt.tzinfo is not None
+
+
+def test_validate_date_rejects_two_digit_year():
+    assert _validate_date("01.02.25") is None
+
+
+def test_validate_date_rejects_unpadded_parts():
+    assert _validate_date("1.2.2025") is None
+
+
+def test_validate_date_rejects_garbage():
+    assert _validate_date("31.02.2025") is None
+    assert _validate_date("aa.bb.cccc") is None
+    assert _validate_date("01-02-2025") is None
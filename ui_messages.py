@@ -4,6 +4,17 @@ from typing import Dict, Any, Optional
 import json
 
 
+# Маппинг статусов на emoji + текст
+_STATUS_MAP = {
+    "ACCEPTED": "✅ Принято",
+    "DECLINED": "❌ Отклонено",
+    "TENTATIVE": "❓ Возможно",
+    "NEEDS-ACTION": "⏳ Ожидает действия",
+    "CONFIRMED": "✅ Подтверждено",
+    "CANCELLED": "🚫 Отменено",
+}
+
+
 class UserState(Enum):
     """Состояния пользователя"""
     UNAUTHENTICATED = "unauthenticated"
@@ -74,16 +85,7 @@ class UIMessages:
         from_time = start.strftime("%d.%m.%Y %H:%M")
         to_time = end.strftime("%H:%M")
         
-        # Маппинг статусов на emoji + текст
-        status_map = {
-            "ACCEPTED": "✅ Принято",
-            "DECLINED": "❌ Отклонено",
-            "TENTATIVE": "❓ Возможно",
-            "NEEDS-ACTION": "⏳ Ожидает действия",
-            "CONFIRMED": "✅ Подтверждено",
-            "CANCELLED": "🚫 Отменено",
-        }
-        status_display = status_map.get(status.upper(), status)
+        status_display = _STATUS_MAP.get(status.upper(), status)
         
         message = f"""**Название встречи:** {title}
 
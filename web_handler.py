@@ -1,9 +1,9 @@
 from aiohttp import web
-import json
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 from config import Config
-from ui_messages import ButtonActions
+from ui_messages import ButtonActions, UIMessages
+from caldav_manager import CalDAVManager
 
 logger = logging.getLogger(__name__)
 
@@ -96,7 +96,7 @@ class ActionHandler:
             meetings = await self.bot.logic.get_today_meetings(
                 user_id,
                 user.email,
-                self.bot.logic.encryption.decrypt(user.encrypted_password),
+                self.bot.logic.decrypt_user_password(user),
             )
 
             message, props = self._compose_meetings_response(
@@ -124,7 +124,7 @@ class ActionHandler:
             meetings = await self.bot.logic.get_current_meetings(
                 user_id,
                 user.email,
-                self.bot.logic.encryption.decrypt(user.encrypted_password),
+                self.bot.logic.decrypt_user_password(user),
             )
 
             message, props = self._compose_meetings_response(
@@ -156,7 +156,7 @@ class ActionHandler:
             user_state = self.bot.logic.get_user_state(user_id)
             if not user_state or user_state.state != "creating_meeting_date":
                 return
-            state_data = json.loads(user_state.data) if user_state.data else {}
+            state_data = self.bot.logic.get_state_data(user_state)
             date_obj = self.bot.logic.validate_date(date_value)
             if not date_obj:
                 await self.bot.mm.send_message(channel_id, "❌ Не удалось распознать дату. Введите вручную DD.MM.YYYY")
@@ -180,7 +180,7 @@ class ActionHandler:
             user_state = self.bot.logic.get_user_state(user_id)
             if not user_state or user_state.state != "creating_meeting_time":
                 return
-            state_data = json.loads(user_state.data) if user_state.data else {}
+            state_data = self.bot.logic.get_state_data(user_state)
             time_obj = self.bot.logic.validate_time(time_value)
             if not time_obj:
                 await self.bot.mm.send_message(channel_id, "❌ Не удалось распознать время. Введите вручную HH:MM")
@@ -213,7 +213,7 @@ class ActionHandler:
         """Пропустить добавление описания"""
         try:
             user_state = self.bot.logic.get_user_state(user_id)
-            state_data = json.loads(user_state.data) if user_state.data else {}
+            state_data = self.bot.logic.get_state_data(user_state)
             
             state_data['description'] = ""
             
@@ -235,7 +235,7 @@ class ActionHandler:
         """Пропустить добавление места"""
         try:
             user_state = self.bot.logic.get_user_state(user_id)
-            state_data = json.loads(user_state.data) if user_state.data else {}
+            state_data = self.bot.logic.get_state_data(user_state)
             
             state_data['location'] = ""
             
@@ -257,7 +257,7 @@ class ActionHandler:
         """Обработать кнопку "Никого не приглашать""" 
         try:
             user_state = self.bot.logic.get_user_state(user_id)
-            state_data = json.loads(user_state.data) if user_state and user_state.data else {}
+            state_data = self.bot.logic.get_state_data(user_state)
 
             state_data['attendees'] = []
             
@@ -297,7 +297,7 @@ class ActionHandler:
             meetings = await self.bot.logic.get_today_meetings(
                 user_id,
                 user.email,
-                self.bot.logic.encryption.decrypt(user.encrypted_password),
+                self.bot.logic.decrypt_user_password(user),
             )
             meeting = None
             for m in meetings:
@@ -309,11 +309,8 @@ class ActionHandler:
                 await self.bot.mm.send_message(channel_id, "Не удалось найти эту встречу")
                 return
 
-            from ui_messages import UIMessages
-            from datetime import datetime
-
-            start_dt = datetime.fromisoformat(meeting["start_time"])
-            end_dt = datetime.fromisoformat(meeting["end_time"])
+            start_dt = meeting["_start_dt"]
+            end_dt = meeting["_end_dt"]
             attendees = meeting.get("attendees", [])
             description = meeting.get("description", "")
             location = meeting.get("location", "")
@@ -355,21 +352,15 @@ class ActionHandler:
                 await self.bot.mm.send_message(channel_id, "Пожалуйста, авторизуйтесь сначала")
                 return
             
-            from datetime import datetime, timedelta
-            import pytz
-            from config import Config
-            
             # Получить события на сегодня
-            tz = pytz.timezone(Config.TZ)
-            now = datetime.now(tz)
+            now = datetime.now(self.bot.logic.tz)
             start = now.replace(hour=0, minute=0, second=0, microsecond=0)
             end = start + timedelta(days=1)
             
             # Создать CalDAV manager
-            from caldav_manager import CalDAVManager
             caldav_manager = CalDAVManager(
                 user.email,
-                self.bot.logic.encryption.decrypt(user.encrypted_password)
+                self.bot.logic.decrypt_user_password(user)
             )
             
             # Получить RAW XML